@@ -1,6 +1,6 @@
 '''
    everything.exe (https://www.voidtools.com/) but rewritten in python.
-   (displaying icons makes super and crash. working on this 20250913)
+   Icons are extracted off the Tk thread, one per file type (per file for .exe/.lnk).
 '''
 
 import os
@@ -8,9 +8,8 @@ import sys
 import time
 import threading
 import queue
-import sqlite3
-import fnmatch
-import re
+import concurrent.futures
+from collections import OrderedDict
 import ctypes
 from ctypes import wintypes as wt
 from PIL import Image, ImageTk
@@ -18,18 +17,24 @@ from datetime import datetime
 import ctypes
 from ctypes import wintypes as wt
 from PIL import Image, ImageTk
-from pathlib import Path
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 
-APP_NAME = "PyEverything"
-DB_DIR = Path(os.getenv("LOCALAPPDATA") or Path.home() / ".local") / APP_NAME
-DB_PATH = DB_DIR / "index.db"
+from pyeverything_core import (
+    APP_NAME, DEFAULT_ROOTS, RESULT_LIMIT,
+    QueryCancelled, QuerySyntaxError, init_shards, scan_shards, start_shard_watchers,
+    query_shards, shard_entries, split_content, search_content, find_duplicates,
+    record, recent_stats,
+)
 
-DEFAULT_ROOTS = [str(Path.home())]  # change/add more roots if you want
-RESULT_LIMIT = 5000                 # safety cap for UI
 SEARCH_DEBOUNCE_MS = 120            # feel free to tweak
+VIEW_PREFETCH = 64                  # rows past the viewport whose icons get warmed
+STATS_REFRESH_MS = 1000             # stats window refresh
+STATS_SEARCHES = 15                 # searches listed in the stats window
 ENABLE_ICONS = True
+ICON_CACHE_SIZE = 512               # Tk images kept alive (LRU)
+ICON_POLL_MS = 40                   # how often finished icons are painted in
+PER_FILE_ICONS = {".exe", ".lnk", ".ico", ".cur", ".ani"}  # icon lives in the file itself
 
 # --- Win32 bits
 SHGFI_ICON              = 0x000000100
@@ -83,20 +88,6 @@ user32  = ctypes.windll.user32
 gdi32   = ctypes.windll.gdi32
 shell32 = ctypes.windll.shell32
 
-SCHEMA = """
-PRAGMA journal_mode=WAL;
-CREATE TABLE IF NOT EXISTS files (
-    path TEXT PRIMARY KEY,
-    name TEXT NOT NULL,
-    parent TEXT NOT NULL,
-    size INTEGER,
-    mtime REAL
-);
-CREATE INDEX IF NOT EXISTS idx_files_name ON files(name);
-CREATE INDEX IF NOT EXISTS idx_files_parent ON files(parent);
-"""
-
-
 def _hicon_to_pil(hicon, size=16):
     # Defensive: verify handle looks valid
     if not hicon:
@@ -144,75 +135,57 @@ def _hicon_to_pil(hicon, size=16):
     return Image.frombuffer("RGBA", (size, size), data, "raw", "BGRA", 0, 1)
 
 
-_icon_cache = {}  # (path.lower(), size) -> Tk PhotoImage
+_icon_cache = OrderedDict()  # icon_key -> PhotoImage, or None if Windows had none
 
-def file_icon_photoimage(path, size=16):
-    if not ENABLE_ICONS:
-        return None
-    key = (path.lower(), size)
-    if key in _icon_cache:
-        return _icon_cache[key]
+def icon_key(path, size=16):
+    """Most types share one icon, so key by extension; .exe/.lnk carry their own."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in PER_FILE_ICONS:
+        return (path.lower(), size)
+    return (ext, size)
 
-    # Ask Windows for the associated icon by attributes (doesn't open the file)
+def extract_icon(path, size=16):
+    """SHGetFileInfoW + GDI -> PIL image (or None). No Tk calls, so any thread may run it."""
     sfi = SHFILEINFO()
-    flags = SHGFI_ICON | SHGFI_USEFILEATTRIBUTES | SHGFI_SMALLICON
-    ok = shell32.SHGetFileInfoW(path, FILE_ATTRIBUTE_NORMAL,
-                                ctypes.byref(sfi), ctypes.sizeof(sfi), flags)
-    if not ok or not sfi.hIcon:
-        return None
-
-    pil_img = _hicon_to_pil(sfi.hIcon, size=size)
-    if pil_img is None:
-        return None
-
-    tk_img = ImageTk.PhotoImage(pil_img)
-    _icon_cache[key] = tk_img
-    return tk_img
-
-
-_icon_cache = {}  # (path.lower(), size) -> PhotoImage (kept alive)
-
-def file_icon_photoimage(path, size=16):
-    """Return a Tk PhotoImage for the file/folder icon (cached)."""
-    key = (path.lower(), size)
-    if key in _icon_cache:
-        return _icon_cache[key]
-
-    sfi = SHFILEINFO()
-    flags = SHGFI_ICON | SHGFI_USEFILEATTRIBUTES | SHGFI_SMALLICON
-    # We ask by attributes to avoid touching the actual file
+    flags = SHGFI_ICON | SHGFI_SMALLICON
+    if os.path.splitext(path)[1].lower() not in PER_FILE_ICONS:
+        # ask by attributes so the file itself isn't touched
+        flags |= SHGFI_USEFILEATTRIBUTES
     if not shell32.SHGetFileInfoW(path, FILE_ATTRIBUTE_NORMAL,
                                   ctypes.byref(sfi), ctypes.sizeof(sfi), flags):
         return None
     if not sfi.hIcon:
         return None
-
-    pil_img = _hicon_to_pil(sfi.hIcon, size=size)
-    if pil_img is None:
-        return None
-    tk_img = ImageTk.PhotoImage(pil_img)
+    return _hicon_to_pil(sfi.hIcon, size=size)
+
+def cached_icon(key):
+    """(hit, PhotoImage or None); refreshes the entry's LRU position."""
+    if key not in _icon_cache:
+        return False, None
+    _icon_cache.move_to_end(key)
+    return True, _icon_cache[key]
+
+def store_icon(key, pil_img):
+    """Wrap in a PhotoImage (Tk thread only) and cache it, evicting the oldest."""
+    tk_img = ImageTk.PhotoImage(pil_img) if pil_img is not None else None
     _icon_cache[key] = tk_img
+    while len(_icon_cache) > ICON_CACHE_SIZE:
+        _icon_cache.popitem(last=False)
     return tk_img
 
-def treeview_sort_column(tree, col, reverse, is_numeric=False):
-    """Sort Treeview by given column. If is_numeric, sort as int."""
-    data = [
-        (tree.set(k, col), k) 
-        for k in tree.get_children("")
-    ]
-    if is_numeric:
-        # Convert text to int safely (strip commas, KB, etc.)
-        data = [(int(v.split()[0].replace(",", "")), k) for v, k in data]
-
-    # Sort data
-    data.sort(reverse=reverse)
-
-    # Reorder rows in tree
-    for idx, (val, k) in enumerate(data):
-        tree.move(k, "", idx)
+def file_icon_photoimage(path, size=16):
+    """Return a Tk PhotoImage for the file's icon (cached). Blocks; the App uses its worker."""
+    if not ENABLE_ICONS:
+        return None
+    key = icon_key(path, size)
+    hit, tk_img = cached_icon(key)
+    if hit:
+        return tk_img
+    return store_icon(key, extract_icon(path, size))
 
-    # Toggle sort on next click
-    tree.heading(col, command=lambda: treeview_sort_column(tree, col, not reverse, is_numeric=is_numeric))
+def _icon_thread_init():
+    # SHGetFileInfo needs COM on the calling thread
+    ctypes.windll.ole32.CoInitialize(None)
 
 def human_size(n):
     """Return size in KB with commas as thousand separators."""
@@ -223,97 +196,6 @@ def human_size(n):
     kb = max(1, n // 1024)  # round down to KB, but never 0
     return f"{kb:,} KB"
 
-def init_db():
-    DB_DIR.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(DB_PATH)
-    con.execute("PRAGMA synchronous=NORMAL")
-    con.execute("PRAGMA temp_store=MEMORY")
-    for stmt in filter(None, SCHEMA.split(";")):
-        con.execute(stmt)
-    con.commit()
-    return con
-
-def scan_roots(roots, progress_cb=None, stop_flag=None):
-    """Walk roots and (up)sert into DB. Runs in worker thread."""
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    total = 0
-    t0 = time.time()
-    for root in roots:
-        root = os.path.abspath(root)
-        for dirpath, dirnames, filenames in os.walk(root):
-            if stop_flag and stop_flag.is_set():
-                con.commit()
-                con.close()
-                return
-            parent = dirpath
-            rows = []
-            # files
-            for fn in filenames:
-                p = os.path.join(dirpath, fn)
-                try:
-                    st = os.stat(p, follow_symlinks=False)
-                    rows.append((
-                        p,
-                        fn.lower(),
-                        parent.lower(),
-                        st.st_size,
-                        st.st_mtime
-                    ))
-                except Exception:
-                    continue
-            # folders themselves (optional: include to find folders by name)
-            for dn in dirnames:
-                p = os.path.join(dirpath, dn)
-                try:
-                    st = os.stat(p, follow_symlinks=False)
-                    rows.append((
-                        p,
-                        dn.lower(),
-                        parent.lower(),
-                        st.st_size if hasattr(st, "st_size") else 0,
-                        st.st_mtime
-                    ))
-                except Exception:
-                    continue
-
-            if rows:
-                cur.executemany("""
-                INSERT INTO files(path, name, parent, size, mtime)
-                VALUES(?,?,?,?,?)
-                ON CONFLICT(path) DO UPDATE SET
-                    name=excluded.name,
-                    parent=excluded.parent,
-                    size=excluded.size,
-                    mtime=excluded.mtime
-                """, rows)
-                total += len(rows)
-
-            if total % 5000 == 0:
-                con.commit()
-                if progress_cb:
-                    progress_cb(total)
-
-    con.commit()
-    con.close()
-    if progress_cb:
-        dt = time.time() - t0
-        progress_cb(total, done=True, seconds=dt)
-
-def wildcard_to_regex(pattern):
-    # Convert * and ? to regex; allow plain substring if no wildcard
-    if not pattern:
-        return None
-    # If user typed /regex/... allow true regex
-    if len(pattern) >= 2 and pattern.startswith("/") and pattern.endswith("/"):
-        try:
-            return re.compile(pattern[1:-1], re.IGNORECASE)
-        except re.error:
-            return None
-    # Else turn glob into regex
-    rx = fnmatch.translate(pattern)
-    return re.compile(rx, re.IGNORECASE)
-
 def fmt_mtime(v):
     """Accept float epoch, int, ISO string, or None -> 'YYYY-MM-DD HH:MM'."""
     if v is None:
@@ -329,51 +211,6 @@ def fmt_mtime(v):
     s = s.replace("T", " ").replace("Z", "")
     return s[:16]
 
-def query_db(pattern, in_path=False, limit=RESULT_LIMIT, parent_filter=None):
-    """Search by wildcard/regex. SQLite used for coarse prefilter, Python for final match.
-       Returns mtime in ISO 8601 format (e.g., 2025-09-12T21:15:30)."""
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-
-    # Build coarse LIKE filter to avoid scanning entire table
-    core = re.sub(r"[\*\?]", "", pattern).strip()
-    like_token = f"%{core.lower()}%" if core else "%"
-    base_sql = "SELECT path, name, parent, size, mtime FROM files"
-    where = []
-    params = []
-
-    if parent_filter:
-        where.append("parent LIKE ?")
-        params.append(f"%{parent_filter.lower()}%")
-
-    if in_path:
-        where.append("path LIKE ?")
-        params.append(like_token)
-    else:
-        where.append("name LIKE ?")
-        params.append(like_token)
-
-    sql = base_sql + " WHERE " + " AND ".join(where) + " LIMIT ?"
-    params.append(limit * 4)  # fetch more for final regex filter
-
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    con.close()
-
-    rx = wildcard_to_regex(pattern)
-    out = []
-    for p, n, parent, size, mtime in rows:
-        target = p if in_path else n
-        if rx is None or rx.search(target):
-            try:
-                iso_mtime = datetime.fromtimestamp(mtime).isoformat(timespec="seconds")
-            except Exception:
-                iso_mtime = ""
-            out.append((p, n, parent, size, iso_mtime))
-            if len(out) >= limit:
-                break
-    return out
-    
 class App(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -389,7 +226,27 @@ class App(tk.Tk):
 
         self._search_after = None
         self._work_q = queue.Queue()
+        self._query_gen = 0             # bumped per search; older ones are stale
+        self._shown_gen = 0             # search whose rows are on screen
+        self._search_info = None        # timings of the search being painted
+        self._stats_win = None
+        self._poll_after = None
+        # one long-lived thread runs every query instead of a thread per keystroke
+        self._query_exec = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="query")
+        # duplicate hashing can take hours; it gets its own thread and stop flag
+        self._dupe_exec = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="dupes")
+        self._dupe_stop = threading.Event()
+        self._dupe_job = None
+        # icons are extracted here and painted in by _poll_icons
+        self._icon_exec = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="icons", initializer=_icon_thread_init)
+        self._icon_q = queue.Queue()
+        self._icon_pending = set()
+        self._icon_after = None
         self._stop_index_flag = threading.Event()
+        self._watcher = None
 
         self._build_ui()
         self._ensure_db()
@@ -408,30 +265,47 @@ class App(tk.Tk):
         ttk.Label(top, text=" In folder filter:").pack(side="left", padx=(12,2))
         ttk.Entry(top, textvariable=self.parent_filter_var, width=24).pack(side="left")
 
-        ttk.Button(top, text="Reindex", command=self.reindex).pack(side="right")
+        # Reindex only revisits changed folders; a full pass re-stats every file,
+        # which is the only way to pick up files rewritten in place
+        ttk.Button(top, text="Full reindex", command=lambda: self.reindex(full=True)).pack(side="right")
+        reindex_btn = ttk.Button(top, text="Reindex", command=self.reindex)
+        reindex_btn.pack(side="right", padx=(0,6))
+        reindex_btn.bind("<Shift-Button-1>", lambda e: (self.reindex(full=True), "break")[1])
+        ttk.Button(top, text="Duplicates", command=self.find_dupes).pack(side="right", padx=(0,6))
+        ttk.Button(top, text="Stats", command=self.show_stats).pack(side="right", padx=(0,6))
         ttk.Button(top, text="Roots…", command=self.choose_roots).pack(side="right", padx=(0,6))
 
 
         cols = ("folder", "size", "modified", "fullpath")
-        self.tree = ttk.Treeview(self, columns=cols, show="tree headings", height=20)
-        self.tree.heading("#0", text="Name")
+        # Virtual list: the Treeview only ever holds the rows that fit on screen.
+        # self._results is the full result set and self._view_top the index of
+        # the first visible row; scrolling rewrites those items in place.
+        body = ttk.Frame(self)
+        body.pack(fill="both", expand=True, padx=8, pady=(0,8))
+        self.vsb = ttk.Scrollbar(body, orient="vertical", command=self._on_vscroll)
+        self.vsb.pack(side="right", fill="y")
+        self.tree = ttk.Treeview(body, columns=cols, show="tree headings", height=20)
+        self.tree.heading("#0", text="Name", command=lambda: self._sort_results("name"))
         self.tree.column("#0", width=280)
 
         self.tree.heading("fullpath", text="Full Path")
         self.tree.column("fullpath", width=0, stretch=False)  # hide but keep data
 
-        self.tree.pack(fill="both", expand=True, padx=8, pady=(0,8))
-        self.tree.heading("folder", text="Path", command=lambda: treeview_sort_column(self.tree, "folder", False, is_numeric=False))
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.tree.heading("folder", text="Path", command=lambda: self._sort_results("folder"))
         self.tree.column("folder", width=320)
         
-        self.tree.heading("size", text="Size", command=lambda: treeview_sort_column(self.tree, "size", False, is_numeric=True))
+        self.tree.heading("size", text="Size", command=lambda: self._sort_results("size"))
         self.tree.column("size", width=90, anchor="e")
         
-        self.tree.heading("modified", text="Date Modified", command=lambda: treeview_sort_column(self.tree, "modified", False, is_numeric=False))
+        self.tree.heading("modified", text="Date Modified", command=lambda: self._sort_results("mtime"))
         self.tree.column("modified", width=160, anchor="e")
+        self.tree.tag_configure("group", background="#e8e8e8")   # duplicate group headers
         
-        # keep icon refs alive
-        self._row_icons = {}
+        self._results = []
+        self._view_top = 0
+        self._sel_index = None          # selected row as an index into _results
+        self._sort = (None, False)      # (ORDER_BY key, descending)
 
 
 
@@ -446,8 +320,19 @@ class App(tk.Tk):
         self.search_var.trace_add("write", lambda *_: self._on_search_changed())
         self.in_path_var.trace_add("write", lambda *_: self._on_search_changed())
         self.parent_filter_var.trace_add("write", lambda *_: self._on_search_changed())
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
         self.tree.bind("<Return>", self._open_selected)
         self.tree.bind("<Double-1>", self._open_selected)
+        self.tree.bind("<Configure>", lambda e: self._render_window())
+        self.tree.bind("<MouseWheel>", lambda e: self._scroll_by(-e.delta // 120 * 3))
+        self.tree.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_by(3))
+        self.tree.bind("<Up>", lambda e: self._on_arrow(-1))
+        self.tree.bind("<Down>", lambda e: self._on_arrow(1))
+        self.tree.bind("<Prior>", lambda e: self._scroll_by(-self._visible_rows()))
+        self.tree.bind("<Next>", lambda e: self._scroll_by(self._visible_rows()))
+        self.tree.bind("<Home>", lambda e: self._scroll_to(0))
+        self.tree.bind("<End>", lambda e: self._scroll_to(len(self._results)))
 
 
 
@@ -468,15 +353,23 @@ class App(tk.Tk):
         self.parent_filter_var.set("")
 
     def _ensure_db(self):
-        init_db()
-        # If DB is empty, prompt to index
-        con = sqlite3.connect(DB_PATH)
-        cur = con.cursor()
-        cur.execute("SELECT COUNT(1) FROM files")
-        n = cur.fetchone()[0]
-        con.close()
-        if n == 0:
+        # one index per root; if they're all empty, index now
+        init_shards(self.roots)
+        if shard_entries(self.roots) == 0:
             self.after(500, self.reindex)
+        else:
+            self._start_watcher()
+
+    def _start_watcher(self):
+        """Keep the index live between reindexes (inotify or polling)."""
+        self._stop_watcher()
+        self._watcher = start_shard_watchers(
+            self.roots, on_change=lambda n: self.after(0, self._on_index_changed))
+
+    def _stop_watcher(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
 
     def choose_roots(self):
         roots = []
@@ -494,21 +387,22 @@ class App(tk.Tk):
             self.status_var.set(f"Roots set: {', '.join(self.roots)}")
             self.reindex()
 
-    def reindex(self):
+    def reindex(self, full=False):
         if hasattr(self, "_index_thread") and self._index_thread.is_alive():
             if messagebox.askyesno(APP_NAME, "Index is running. Stop and restart?"):
                 self._stop_index_flag.set()
             else:
                 return
 
+        self._stop_watcher()
         self._stop_index_flag.clear()
         self.progress.configure(mode="indeterminate")
         self.progress.start(50)
-        self.status_var.set("Indexing…")
+        self.status_var.set("Indexing (full)…" if full else "Indexing…")
         self._index_thread = threading.Thread(
-            target=scan_roots,
+            target=scan_shards,
             args=(self.roots, self._on_progress,),
-            kwargs={"stop_flag": self._stop_index_flag},
+            kwargs={"stop_flag": self._stop_index_flag, "incremental": not full},
             daemon=True
         )
         self._index_thread.start()
@@ -521,11 +415,21 @@ class App(tk.Tk):
             if seconds is not None and seconds > 0:
                 msg += f" in {seconds:.1f}s"
             self.status_var.set(msg)
+            self._start_watcher()
             # auto-run search to refresh results
-            self._search_now()
+            self._on_index_changed()
         else:
             self.status_var.set(f"Indexed {count:,} entries…")
 
+    def _dupes_running(self):
+        return self._dupe_job is not None and not self._dupe_job.done()
+
+    def _on_index_changed(self):
+        """Refresh the results after the index changed, unless they are (about
+           to be) a duplicate listing: a background change shouldn't cancel it."""
+        if not self._dupes_running():
+            self._on_search_changed()
+
     def _on_search_changed(self):
         if self._search_after:
             self.after_cancel(self._search_after)
@@ -535,61 +439,341 @@ class App(tk.Tk):
         pat = self.search_var.get().strip()
         in_path = self.in_path_var.get()
         parent_f = self.parent_filter_var.get().strip()
+        self._dupe_stop.set()           # a new search replaces a duplicate run
         self.status_var.set("Searching…")
-        self.tree.delete(*self.tree.get_children())
+        # the old rows stay up until the new search's first batch replaces them
+
+        order_by, descending = self._sort
+        self._query_gen += 1
+        gen = self._query_gen
+        superseded = lambda: gen != self._query_gen
+
+        name_pat, needle = split_content(pat)
+        partial = lambda rows: self._work_q.put((gen, rows, False))
+        qstats = {}
+        self._search_info = {"gen": gen, "pattern": pat, "t0": time.perf_counter(),
+                             "render_s": 0.0, "query": qstats}
 
         def worker():
+            if superseded():
+                return          # still queued when a newer search came in
             try:
-                rows = query_db(pat if pat else "%", in_path=in_path,
-                                limit=RESULT_LIMIT,
-                                parent_filter=parent_f if parent_f else None)
+                if needle is not None:
+                    # content hits stream in as the pool finds them
+                    search_content(name_pat, needle, in_path=in_path,
+                                   parent_filter=parent_f if parent_f else None,
+                                   limit=RESULT_LIMIT, cancel=superseded,
+                                   on_rows=partial, roots=self.roots)
+                else:
+                    # every root's shard at once; unsorted rows show per shard
+                    query_shards(pat if pat else "%", self.roots, in_path=in_path,
+                                 limit=RESULT_LIMIT,
+                                 parent_filter=parent_f if parent_f else None,
+                                 cancel=superseded,
+                                 order_by=order_by, descending=descending,
+                                 on_rows=partial, stats=qstats)
+                rows = []
+            except QueryCancelled:
+                return
+            except QuerySyntaxError as e:
+                rows = e        # half-typed operator: say so in the status bar
             except Exception as e:
                 rows = []
                 err = str(e)
                 self.after(0, lambda: messagebox.showerror(APP_NAME, f"Query error:\n{err}"))
-            self._work_q.put(rows)
+            self._work_q.put((gen, rows, True))
 
-        threading.Thread(target=worker, daemon=True).start()
-        self.after(30, self._poll_results)
+        self._query_exec.submit(worker)
+        if self._poll_after:
+            self.after_cancel(self._poll_after)
+        self._poll_after = self.after(30, self._poll_results)
 
-    def _poll_results(self):
-        try:
-            rows = self._work_q.get_nowait()
-        except queue.Empty:
-            self.after(30, self._poll_results)
+    def find_dupes(self):
+        """List duplicate files (within the folder filter), biggest waste first."""
+        if self._dupes_running():
+            self._dupe_stop.set()       # second click cancels
             return
+        parent_f = self.parent_filter_var.get().strip()
+        self.status_var.set("Looking for duplicates… (click Duplicates again to cancel)")
+        self._set_results([])
+        self._query_gen += 1
+        gen = self._shown_gen = self._query_gen
+        stop = self._dupe_stop = threading.Event()
+
+        def status(msg):
+            if gen == self._query_gen:
+                self.status_var.set(msg)
 
-        for p, n, parent, size, iso_m in rows:
-            mtime_disp = fmt_mtime(iso_m)
-            icon = None
+        def worker():
             try:
-                icon = file_icon_photoimage(p, size=16)
-            except Exception:
-                icon = None
-            if icon:
-                self._row_icons[p] = icon
-
-            display_name = os.path.basename(p)
-
-            insert_kwargs = {"text": display_name}
-            icon_obj = self._row_icons.get(p)
-            if icon_obj is not None:  # ← only pass image if real
-                insert_kwargs["image"] = icon_obj
-
-            self.tree.insert(
-                "", "end",
-                values=(parent, human_size(size), mtime_disp, p),
-                **insert_kwargs
+                groups = find_duplicates(
+                    parent_filter=parent_f if parent_f else None,
+                    roots=self.roots, stop_flag=stop,
+                    progress_cb=lambda msg: self.after(0, lambda: status(msg)))
+                # a header row (no path) ahead of each group: "3 × 1,024 KB"
+                rows = [r for g in groups
+                        for r in [("", f"{len(g)} × {human_size(g[0][3])}", "", None, None)] + g]
+            except QueryCancelled:
+                self.after(0, lambda: status("Duplicate search cancelled"))
+                return
+            except Exception as e:
+                rows = []
+                err = str(e)
+                self.after(0, lambda: messagebox.showerror(APP_NAME, f"Duplicate search error:\n{err}"))
+            self._work_q.put((gen, rows, True))
+
+        self._dupe_job = self._dupe_exec.submit(worker)
+        if self._poll_after:
+            self.after_cancel(self._poll_after)
+        self._poll_after = self.after(30, self._poll_results)
+
+    def _poll_results(self):
+        added, done, replace = [], False, False
+        while True:
+            try:
+                gen, got, last = self._work_q.get_nowait()
+            except queue.Empty:
+                break
+            if gen != self._query_gen:
+                continue        # only the latest search gets painted
+            if isinstance(got, QuerySyntaxError):
+                self._poll_after = None
+                self.status_var.set(f"Search syntax: {got}")
+                return
+            if self._shown_gen != gen and (got or last):
+                self._shown_gen = gen   # first rows of this search: swap the list
+                replace = True
+            added += got
+            done = done or last
+        info = self._search_info
+        if added or replace:
+            t = time.perf_counter()
+            if replace:
+                self._set_results(added)
+            else:
+                self._append_results(added)
+            self.update_idletasks()     # count the Treeview's redraw too
+            if info and info["gen"] == self._query_gen:
+                info["render_s"] += time.perf_counter() - t
+        if not done:
+            if added:
+                self.status_var.set(f"{len(self._results):,} results so far…")
+            self._poll_after = self.after(30, self._poll_results)
+            return
+        self._poll_after = None
+        found = sum(1 for r in self._results if r[0])     # not counting group headers
+        self.status_var.set(f"{found:,} results")
+        if info and info["gen"] == self._query_gen:
+            self._search_info = None
+            q = info["query"]
+            record("search", pattern=info["pattern"],
+                   seconds=round(time.perf_counter() - info["t0"], 6),
+                   sql_s=round(q.get("sql_s", 0.0), 6),
+                   filter_s=round(q.get("filter_s", 0.0), 6),
+                   render_s=round(info["render_s"], 6),
+                   examined=q.get("examined", 0), returned=len(self._results))
+
+    # --- stats window
+    def show_stats(self):
+        if self._stats_win is not None and self._stats_win.winfo_exists():
+            self._stats_win.lift()
+            return
+        win = tk.Toplevel(self)
+        win.title(f"{APP_NAME} stats")
+        win.geometry("760x420")
+        text = tk.Text(win, wrap="none", font="TkFixedFont")
+        text.pack(fill="both", expand=True)
+        self._stats_win = win
+        self._refresh_stats(text)
+
+    def _refresh_stats(self, text):
+        if self._stats_win is None or not self._stats_win.winfo_exists():
+            self._stats_win = None
+            return
+        lines = ["Last index pass per shard (entries/s by phase; walk+stat summed over threads)"]
+        last = {}
+        for r in recent_stats("index"):
+            last[r["db"]] = r
+        for r in last.values():
+            state = "aborted" if r["aborted"] else ("incremental" if r["incremental"] else "full")
+            lines.append(f"  {', '.join(r['roots'])}: {r['entries']:,} entries in "
+                         f"{r['seconds']:.1f}s ({state})")
+            for ph in ("walk", "stat", "insert", "commit"):
+                p = r["phases"].get(ph)
+                if p:
+                    rate = f"{p['per_sec']:,}/s" if p["per_sec"] is not None else "-"
+                    lines.append(f"    {ph:<7}{p['entries']:>12,} in {p['seconds']:>8.3f}s  {rate:>12}")
+        lines += ["", "Recent searches (ms)  total    sql  regex render   examined -> returned"]
+        for r in recent_stats("search")[-STATS_SEARCHES:][::-1]:
+            lines.append(f"  {r['pattern'][:18]:<18} {r['seconds']*1000:7.1f} {r['sql_s']*1000:6.1f} "
+                         f"{r['filter_s']*1000:6.1f} {r['render_s']*1000:6.1f} "
+                         f"{r['examined']:>10,} -> {r['returned']:,}")
+        text.configure(state="normal")
+        text.delete("1.0", "end")
+        text.insert("1.0", "\n".join(lines))
+        text.configure(state="disabled")
+        self.after(STATS_REFRESH_MS, lambda: self._refresh_stats(text))
+
+    # --- virtual list
+    def _set_results(self, rows):
+        self._results = rows
+        self._view_top = 0
+        self._sel_index = None
+        self._render_window()
+
+    def _append_results(self, rows):
+        self._results = self._results + rows
+        self._render_window()
+
+    def _visible_rows(self):
+        rh = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        return max(1, self.tree.winfo_height() // rh - 1)  # minus the heading
+
+    def _render_window(self):
+        """Materialize only the rows in view, reusing the same Treeview items."""
+        n = self._visible_rows()
+        total = len(self._results)
+        self._view_top = max(0, min(self._view_top, total - n))
+        window = self._results[self._view_top:self._view_top + n]
+
+        items = self.tree.get_children()
+        if len(items) > len(window):
+            self.tree.delete(*items[len(window):])
+        for _ in range(len(items), len(window)):
+            self.tree.insert("", "end")
+
+        items = self.tree.get_children()
+        for iid, (p, n_, parent, size, iso_m) in zip(items, window):
+            icon = self._icon_for(p) if p else None
+            self.tree.item(
+                iid,
+                text=os.path.basename(p) if p else n_,     # no path: a group header
+                image=icon if icon is not None else "",
+                values=(parent, human_size(size), fmt_mtime(iso_m), p),
+                tags=() if p else ("group",)
             )
+        # the items were reused for other rows: move the highlight with its row
+        sel = self._sel_index
+        if sel is not None and self._view_top <= sel < self._view_top + len(window):
+            iid = items[sel - self._view_top]
+            if self.tree.selection() != (iid,):
+                self.tree.selection_set(iid)
+            self.tree.focus(iid)
+        elif self.tree.selection():
+            self.tree.selection_remove(self.tree.selection())
+
+        if total:
+            self.vsb.set(self._view_top / total, (self._view_top + len(window)) / total)
+        else:
+            self.vsb.set(0, 1)
+        self.after_idle(self._prefetch_icons)
 
-    def _open_selected(self, event=None):
+    def _icon_for(self, p):
+        """Cached icon, or None after queueing its extraction on the icon worker."""
+        if not ENABLE_ICONS:
+            return None
+        key = icon_key(p)
+        hit, icon = cached_icon(key)
+        if not hit and key not in self._icon_pending:
+            self._icon_pending.add(key)
+            self._icon_exec.submit(self._extract_icon, key, p)
+            if self._icon_after is None:
+                self._icon_after = self.after(ICON_POLL_MS, self._poll_icons)
+        return icon
+
+    def _extract_icon(self, key, p):
+        try:
+            img = extract_icon(p, size=key[1])
+        except Exception:
+            img = None
+        self._icon_q.put((key, img))
+
+    def _poll_icons(self):
+        got = False
+        while True:
+            try:
+                key, img = self._icon_q.get_nowait()
+            except queue.Empty:
+                break
+            self._icon_pending.discard(key)
+            store_icon(key, img)
+            got = True
+        if got:
+            self._paint_icons()
+        self._icon_after = (self.after(ICON_POLL_MS, self._poll_icons)
+                            if self._icon_pending else None)
+
+    def _paint_icons(self):
+        """Fill in icons that arrived after their rows were rendered."""
+        window = self._results[self._view_top:]
+        for iid, row in zip(self.tree.get_children(), window):
+            if not row[0]:
+                continue
+            hit, icon = cached_icon(icon_key(row[0]))
+            if hit and icon is not None and not self.tree.item(iid, "image"):
+                self.tree.item(iid, image=icon)
+
+    def _prefetch_icons(self):
+        start = self._view_top + self._visible_rows()
+        for row in self._results[start:start + VIEW_PREFETCH]:
+            if row[0]:
+                self._icon_for(row[0])
+
+    def _scroll_to(self, top):
+        self._view_top = top
+        self._render_window()
+        return "break"
+
+    def _scroll_by(self, delta):
+        return self._scroll_to(self._view_top + delta)
+
+    def _on_vscroll(self, *args):
+        if args[0] == "moveto":
+            self._scroll_to(int(float(args[1]) * len(self._results)))
+        elif args[0] == "scroll":
+            step = self._visible_rows() if args[2] == "pages" else 1
+            self._scroll_by(int(args[1]) * step)
+
+    def _on_select(self, event=None):
+        """Clicks (and our own selection_set) -> self._sel_index."""
         sel = self.tree.selection()
-        if not sel:
-            return
-        vals = self.tree.item(sel[0], "values")
-        if not vals or len(vals) < 4:
+        items = self.tree.get_children()
+        if sel and sel[0] in items:
+            self._sel_index = self._view_top + items.index(sel[0])
+        elif (self._sel_index is not None
+              and self._view_top <= self._sel_index < self._view_top + len(items)):
+            self._sel_index = None      # deselected on screen, not scrolled away
+
+    def _on_arrow(self, delta):
+        """Arrow keys move the selection; at the window edge they scroll."""
+        if not self._results:
+            return "break"
+        if self._sel_index is None:
+            idx = self._view_top
+        else:
+            idx = min(max(self._sel_index + delta, 0), len(self._results) - 1)
+        n = self._visible_rows()
+        if idx < self._view_top:
+            self._view_top = idx
+        elif idx >= self._view_top + n:
+            self._view_top = idx - n + 1
+        self._sel_index = idx
+        self._render_window()
+        return "break"
+
+    def _sort_results(self, col):
+        """Re-run the search ordered by col in SQL; a second click flips it."""
+        order_by, descending = self._sort
+        self._sort = (col, not descending if order_by == col else False)
+        self._search_now()
+
+    def _open_selected(self, event=None):
+        self._on_select()
+        if self._sel_index is None or self._sel_index >= len(self._results):
             return
-        fullpath = vals[3]  # not [4]
+        fullpath = self._results[self._sel_index][0]
+        if not fullpath:
+            return              # a duplicate group header
         try:
             os.startfile(fullpath)
         except Exception as e:
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+'''
+   Reproducible benchmarks for the pyeverything engine (headless, no Tk/Win32).
+   Builds a synthetic tree, then times a full scan, incremental rescans and a
+   fixed query mix against a throwaway index, and writes one JSON report.
+
+     python pyeverything_bench.py --entries 200000
+     python pyeverything_bench.py --entries 10000000 --depth 6 --fanout 8 --names words
+     python pyeverything_bench.py --tree /mnt/fast/bench --out results/$(git rev-parse --short HEAD).json
+
+   The tree is cached: a rerun with the same shape reuses it (see .bench.json
+   in the tree), so only the engine is measured. Files are created sparse
+   (ftruncate), so a 10M entry tree costs inodes, not disk space.
+'''
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import platform
+import statistics
+from pathlib import Path
+
+import pyeverything_core as core
+
+WORDS = ("report invoice backup photo draft config index main test util core data "
+         "cache build release notes readme setup server client model view schema "
+         "export import final summary budget archive video music log temp").split()
+EXTENSIONS = [("txt", 20), ("py", 12), ("log", 10), ("jpg", 10), ("json", 8), ("md", 6),
+              ("pdf", 6), ("dll", 5), ("exe", 3), ("zip", 3), ("csv", 5), ("", 2),
+              ("mp4", 2), ("iso", 1), ("docx", 7)]
+SIZE_MEDIAN = 16 << 10              # sparse file sizes are lognormal around this
+TREE_MANIFEST = ".bench.json"
+
+# (name, pattern, keyword arguments) run against the index; {w} is a WORDS entry
+QUERY_MIX = [
+    ("substring",        "{w}",                   {}),
+    ("substring_short",  "ab",                    {}),
+    ("glob_ext",         "*.py",                  {}),
+    ("glob_mixed",       "{w}*_1?.log",           {}),
+    ("regex",            r"/^{w}_\d+\.(py|md)$/", {}),
+    ("regex_alt",        "/(backup|archive).*zip/", {}),
+    ("path_substring",   "{w}",                   {"in_path": True}),
+    ("folder_filter",    "*.txt",                 {"parent_filter": "d1_"}),
+    ("operators",        "ext:py size:>16kb",     {}),
+    ("sorted_size",      "{w}",                   {"order_by": "size", "descending": True}),
+]
+
+
+# --- synthetic tree
+def _name(rng, style, i):
+    ext = rng.choices([e for e, _ in EXTENSIONS], [w for _, w in EXTENSIONS])[0]
+    if style == "numeric":
+        stem = f"{i:08d}"
+    elif style == "random":
+        stem = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789_-")
+                       for _ in range(rng.randint(4, 24)))
+    elif style == "words":
+        stem = f"{rng.choice(WORDS)}_{rng.randint(0, 9999)}"
+    else:   # mixed
+        stem = _name(rng, rng.choice(("numeric", "random", "words", "words")), i).rsplit(".", 1)[0]
+    return f"{stem}.{ext}" if ext else stem
+
+def tree_shape(entries, depth, fanout):
+    """(folder count, files per folder) for about `entries` entries in total."""
+    dirs = sum(fanout ** d for d in range(1, depth + 1))
+    files_per_dir = max(0, (entries - dirs) // (dirs + 1))
+    return dirs, files_per_dir
+
+def build_tree(top, entries, depth, fanout, names, seed):
+    """Create (or reuse) the synthetic tree under top. Returns its manifest."""
+    top = Path(top)
+    spec = {"entries": entries, "depth": depth, "fanout": fanout, "names": names, "seed": seed}
+    manifest = top / TREE_MANIFEST
+    if manifest.exists():
+        old = json.loads(manifest.read_text())
+        if old.get("spec") == spec:
+            return old
+        shutil.rmtree(top)
+    top.mkdir(parents=True, exist_ok=True)
+
+    rng = random.Random(seed)
+    dirs, per_dir = tree_shape(entries, depth, fanout)
+    t0 = time.perf_counter()
+    made = 0
+    level = [top]
+    folders = [top]
+    for d in range(1, depth + 1):
+        nxt = []
+        for parent in level:
+            for k in range(fanout):
+                p = parent / f"d{d}_{k}_{rng.choice(WORDS)}"
+                p.mkdir()
+                nxt.append(p)
+        folders += nxt
+        level = nxt
+    made += len(folders) - 1
+    for folder in folders:
+        for i in range(per_dir):
+            p = os.path.join(folder, _name(rng, names, made))
+            fd = os.open(p, os.O_CREAT | os.O_WRONLY, 0o644)
+            try:
+                os.ftruncate(fd, int(rng.lognormvariate(0, 1.5) * SIZE_MEDIAN))
+            finally:
+                os.close(fd)
+            made += 1
+    info = {"spec": spec, "dirs": dirs, "files_per_dir": per_dir, "entries": made,
+            "build_seconds": round(time.perf_counter() - t0, 3)}
+    manifest.write_text(json.dumps(info))
+    return info
+
+def churn(top, fraction, seed):
+    """Add a file to `fraction` of the folders: the work an incremental rescan
+       has to find. Returns the added paths."""
+    rng = random.Random(seed + 1)
+    folders = [d for d, _, _ in os.walk(top)]
+    picked = rng.sample(folders, max(1, int(len(folders) * fraction)))
+    stamp = time.time_ns()
+    added = [os.path.join(d, f"churn_{stamp}.txt") for d in picked]
+    for p in added:
+        open(p, "wb").close()
+    return added
+
+
+# --- timing
+def _timed(fn, repeat=1):
+    times, result = [], None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t)
+    return {"seconds_min": round(min(times), 6),
+            "seconds_median": round(statistics.median(times), 6),
+            "runs": repeat}, result
+
+def _last_index_record():
+    recs = core.recent_stats("index")
+    return recs[-1] if recs else None
+
+def bench_scans(top, db_path, churn_fraction, seed):
+    results = {}
+    for suffix in ("", "-wal", "-shm"):
+        Path(str(db_path) + suffix).unlink(missing_ok=True)
+    core.init_db(db_path).close()
+
+    timing, _ = _timed(lambda: core.scan_roots([str(top)], db_path=db_path))
+    results["full_scan"] = {**timing, "index": _last_index_record()}
+
+    timing, _ = _timed(lambda: core.scan_roots([str(top)], incremental=True, db_path=db_path))
+    results["incremental_unchanged"] = {**timing, "index": _last_index_record()}
+
+    added = churn(top, churn_fraction, seed)
+    timing, _ = _timed(lambda: core.scan_roots([str(top)], incremental=True, db_path=db_path))
+    results["incremental_churn"] = {**timing, "files_added": len(added),
+                                    "index": _last_index_record()}
+    for p in added:
+        os.unlink(p)            # leave the cached tree as it was built
+    return results
+
+def bench_queries(db_path, repeat, seed):
+    rng = random.Random(seed + 2)
+    results = {}
+    for name, pattern, kwargs in QUERY_MIX:
+        pattern = pattern.format(w=rng.choice(WORDS))
+        # cold: straight to SQLite; warm: through query_db's result cache
+        stats = {}
+        cold, rows = _timed(lambda: core.query_db_uncached(pattern, db_path=db_path, stats=stats,
+                                                           **kwargs), repeat)
+        warm, _ = _timed(lambda: core.query_db(pattern, db_path=db_path, **kwargs), repeat)
+        results[name] = {"pattern": pattern, "kwargs": kwargs, "rows": len(rows),
+                         "examined": stats.get("examined"),
+                         "sql_s": round(stats.get("sql_s", 0.0), 6),
+                         "filter_s": round(stats.get("filter_s", 0.0), 6),
+                         "cold": cold, "warm": warm}
+        # the same search as a scan of the mapped snapshot, where it applies
+        if core.snapshot_can_answer(pattern, kwargs.get("in_path"), kwargs.get("order_by")):
+            with core.read_connection(db_path) as con:
+                snap = core.snapshot_for(db_path, core.index_version(con))
+            if snap is not None:
+                results[name]["snapshot"], _ = _timed(
+                    lambda: snap.search(pattern, parent_filter=kwargs.get("parent_filter")), repeat)
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark pyeverything's index and query engine")
+    ap.add_argument("--tree", default=None, help="where to build the synthetic tree "
+                    "(default: a bench/ folder next to the index)")
+    ap.add_argument("--entries", type=int, default=100_000, help="files + folders, up to ~10M")
+    ap.add_argument("--depth", type=int, default=4)
+    ap.add_argument("--fanout", type=int, default=6, help="subfolders per folder")
+    ap.add_argument("--names", choices=("words", "random", "numeric", "mixed"), default="mixed")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--churn", type=float, default=0.01,
+                    help="fraction of folders touched before the second rescan")
+    ap.add_argument("--repeat", type=int, default=5, help="runs per query")
+    ap.add_argument("--out", default=None, help="JSON report (default bench-<time>.json)")
+    ap.add_argument("--clean", action="store_true", help="delete the tree afterwards")
+    args = ap.parse_args()
+
+    work = core.DB_DIR / "bench"
+    top = Path(args.tree) if args.tree else work / "tree"
+    db_path = work / "bench.db"
+    work.mkdir(parents=True, exist_ok=True)
+
+    print(f"building tree under {top} …", flush=True)
+    tree = build_tree(top, args.entries, args.depth, args.fanout, args.names, args.seed)
+    print(f"  {tree['entries']:,} entries in {tree['dirs']:,} folders", flush=True)
+
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "python": sys.version.split()[0],
+                 "sqlite": sqlite3.sqlite_version, "cpus": os.cpu_count(),
+                 "scan_workers": core.SCAN_WORKERS},
+        "args": vars(args),
+        "tree": tree,
+    }
+    print("scanning …", flush=True)
+    report["scans"] = bench_scans(top, db_path, args.churn, args.seed)
+    for name, r in report["scans"].items():
+        print(f"  {name:<24}{r['seconds_min']:>9.3f}s", flush=True)
+    print("querying …", flush=True)
+    report["queries"] = bench_queries(db_path, args.repeat, args.seed)
+    for name, r in report["queries"].items():
+        snap = f"{r['snapshot']['seconds_median'] * 1000:>9.2f} ms snapshot" if "snapshot" in r else ""
+        print(f"  {name:<24}{r['cold']['seconds_median'] * 1000:>9.2f} ms cold "
+              f"{r['warm']['seconds_median'] * 1000:>9.2f} ms warm {r['rows']:>8,} rows{snap}",
+              flush=True)
+
+    out = Path(args.out or f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"report: {out}")
+    if args.clean:
+        shutil.rmtree(top, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
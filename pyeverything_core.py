@@ -0,0 +1,1955 @@
+'''
+   pyeverything's indexing and query engine, without the GUI or any Win32 bits,
+   so it can run headless (pyeverythingd.py, scripts, benchmarks).
+'''
+
+import os
+import stat
+import sys
+import time
+import threading
+import queue
+import sqlite3
+import fnmatch
+import re
+import select
+import struct
+import json
+import contextlib
+import functools
+import heapq
+import itertools
+import hashlib
+import collections
+import ctypes
+import mmap
+import array
+import bisect
+import concurrent.futures
+from datetime import datetime, timedelta
+try:
+    from re import _parser as sre_parse, _constants as sre_constants   # 3.11+
+except ImportError:
+    import sre_parse, sre_constants
+from pathlib import Path
+
+APP_NAME = "PyEverything"
+DB_DIR = Path(os.getenv("LOCALAPPDATA") or Path.home() / ".local") / APP_NAME
+DB_PATH = DB_DIR / "index.db"
+
+DEFAULT_ROOTS = [str(Path.home())]  # change/add more roots if you want
+RESULT_LIMIT = 5000                 # safety cap for UI
+SCAN_WORKERS = min(16, (os.cpu_count() or 4) * 2)  # scandir threads (I/O bound)
+SCAN_QUEUE_MAX = 256                # directories buffered for the DB writer
+WATCH_BATCH_MS = 250                # coalesce watcher events per transaction
+WATCH_POLL_SECONDS = 30             # polling fallback interval
+SNAPSHOT_DELAY_SECONDS = 60         # quiet time before a watcher rewrites the snapshot
+QUERY_POOL_SIZE = 2                 # long-lived read-only connections
+QUERY_CACHE_SIZE = 64               # LRU entries of recent query results
+SCAN_COMMIT_ROWS = 5000             # commit (and report progress) every N upserted rows
+STATS_KEEP = 200                    # recent metrics records kept for stats views
+TRACE_PATH = os.getenv("PYEVERYTHING_TRACE") or None  # JSONL file of every record
+CONTENT_WORKERS = os.cpu_count() or 4   # processes scanning file contents
+CONTENT_MAX_BYTES = 64 << 20        # bigger files are skipped by content:
+CONTENT_CANDIDATES = 200_000        # files taken from the index per content search
+CONTENT_BATCH = 64                  # files per pool task
+BINARY_SNIFF = 8192                 # a NUL in this many leading bytes = binary
+DUP_PARTIAL_BYTES = 4096            # hashed from each end of a same-size candidate
+DUP_WORKERS = 8                     # hashing threads (hashlib releases the GIL)
+HASH_CHUNK = 1 << 20                # read size for full hashes
+
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS dirs (
+    id INTEGER PRIMARY KEY,
+    parent_id INTEGER NOT NULL,     -- 0 for a root, whose name is its full path
+    name TEXT NOT NULL,
+    mtime REAL,
+    gen INTEGER,
+    UNIQUE(parent_id, name)
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    dir_id INTEGER NOT NULL,        -- dirs.id of the containing folder
+    name TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    gen INTEGER DEFAULT 0,
+    ext TEXT,                       -- lowercased extension without the dot
+    UNIQUE(dir_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_files_name ON files(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_files_size ON files(size);
+CREATE INDEX IF NOT EXISTS idx_files_mtime ON files(mtime);
+CREATE INDEX IF NOT EXISTS idx_files_ext ON files(ext);
+CREATE TABLE IF NOT EXISTS hashes (  -- digests for the duplicate finder
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    partial BLOB,                   -- first + last DUP_PARTIAL_BYTES
+    full BLOB,                      -- whole file, only once partials collided
+    PRIMARY KEY(path, size, mtime)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS files_tri USING fts5(
+    name,
+    content='files', content_rowid='id',
+    tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS files_tri_ai AFTER INSERT ON files BEGIN
+    INSERT INTO files_tri(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_tri_ad AFTER DELETE ON files BEGIN
+    INSERT INTO files_tri(files_tri, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_tri_au AFTER UPDATE OF name ON files BEGIN
+    INSERT INTO files_tri(files_tri, rowid, name) VALUES ('delete', old.id, old.name);
+    INSERT INTO files_tri(rowid, name) VALUES (new.id, new.name);
+END;
+"""
+TRIGRAM_MIN = 3                     # shorter literals can't use files_tri
+
+# --- metrics
+# Index passes and queries leave one record each: kept in memory for stats
+# views (recent_stats) and, with a trace file set, appended to it as JSONL.
+_stats = collections.deque(maxlen=STATS_KEEP)
+_stats_lock = threading.Lock()
+
+def set_trace(path):
+    """Start (or with None, stop) appending every record to path."""
+    global TRACE_PATH
+    TRACE_PATH = str(path) if path else None
+
+def record(kind, **fields):
+    rec = {"kind": kind, "ts": round(time.time(), 3), **fields}
+    with _stats_lock:
+        _stats.append(rec)
+        if TRACE_PATH:
+            with open(TRACE_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, default=str) + "\n")
+    return rec
+
+def recent_stats(kind=None):
+    """Records still in memory, oldest first, optionally of one kind."""
+    with _stats_lock:
+        return [r for r in _stats if kind is None or r["kind"] == kind]
+
+class PhaseTimer:
+    """Seconds and entries per phase, summed over the threads doing them."""
+
+    def __init__(self):
+        self.seconds = collections.Counter()
+        self.entries = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds, entries=0):
+        with self._lock:
+            self.seconds[phase] += seconds
+            self.entries[phase] += entries
+
+    def report(self):
+        with self._lock:
+            return {ph: {"seconds": round(sec, 4), "entries": self.entries[ph],
+                         "per_sec": round(self.entries[ph] / sec) if sec > 0 else None}
+                    for ph, sec in self.seconds.items()}
+
+
+def _db(db_path):
+    """The index file to use: db_path (a shard), or the single DB_PATH."""
+    return Path(db_path) if db_path else DB_PATH
+
+def init_db(db_path=None):
+    db_path = _db(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA temp_store=MEMORY")
+    cols = [r[1] for r in con.execute("PRAGMA table_info(files)")]
+    changed = False             # only a migration that touched rows moves the version
+    if "path" in cols:
+        # pre-dirs layout (full path per row): drop it, the next scan rebuilds
+        con.executescript("""
+        DROP TRIGGER IF EXISTS files_tri_ai;
+        DROP TRIGGER IF EXISTS files_tri_ad;
+        DROP TRIGGER IF EXISTS files_tri_au;
+        DROP TABLE IF EXISTS files_tri;
+        DROP TABLE IF EXISTS files;
+        DROP TABLE IF EXISTS dirs;
+        """)
+        changed = True
+    elif cols and "ext" not in cols:
+        con.execute("ALTER TABLE files ADD COLUMN ext TEXT")
+        con.create_function("file_ext", 1, file_ext, deterministic=True)
+        changed = con.execute("UPDATE files SET ext=file_ext(name)").rowcount > 0
+    con.executescript(SCHEMA)
+    if "path" in cols:
+        _dirs_deleted(con)
+    _commit(con, bump=changed)
+    return con
+
+def file_ext(name):
+    """'Report.PDF' -> 'pdf'; '' when there is none."""
+    return os.path.splitext(name)[1][1:].lower()
+
+_read_pools = {}                    # db path -> [idle read-only connections (warmest on top), open count]
+_read_pool_lock = threading.Lock()
+
+def _open_reader(db_path):
+    con = sqlite3.connect(f"{db_path.as_uri()}?mode=ro", uri=True,
+                          check_same_thread=False, cached_statements=256)
+    con.execute("PRAGMA query_only=ON")
+    con.execute("PRAGMA mmap_size=268435456")   # 256 MB
+    con.execute("PRAGMA cache_size=-65536")     # 64 MB
+    dirs = _dir_map(db_path)
+    con.create_function("dirpath", 1, lambda i: dirs.path(con, i), deterministic=True)
+    con.create_function("py_lower", 1, lambda s: s.lower() if s else s, deterministic=True)
+    con.create_function("regexp", 2, _regexp, deterministic=True)   # X REGEXP Y
+    return con
+
+@contextlib.contextmanager
+def read_connection(db_path=None):
+    """Borrow a pooled read-only connection to db_path (default DB_PATH).
+       Connections stay open, so the schema, page cache, mmap and prepared
+       statements (sqlite3's per connection statement cache) survive between
+       queries. Each index file has its own pool of QUERY_POOL_SIZE."""
+    db_path = _db(db_path)
+    with _read_pool_lock:
+        pool = _read_pools.setdefault(db_path, [queue.LifoQueue(), 0])
+    try:
+        con = pool[0].get_nowait()
+    except queue.Empty:
+        with _read_pool_lock:
+            grow = pool[1] < QUERY_POOL_SIZE
+            if grow:
+                pool[1] += 1
+        if grow:
+            try:
+                con = _open_reader(db_path)
+            except Exception:
+                with _read_pool_lock:
+                    pool[1] -= 1
+                raise
+        else:
+            con = pool[0].get()
+    try:
+        yield con
+    finally:
+        pool[0].put(con)
+
+def index_generation(con):
+    row = con.execute("SELECT value FROM meta WHERE key='generation'").fetchone()
+    return int(row[0]) if row else 0
+
+def index_version(con):
+    """Bumped on every committed index write (scan batches, watcher batches);
+       cached query results are only valid for the version they were built on."""
+    row = con.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+    return int(row[0]) if row else 0
+
+def _commit(con, bump=True):
+    """Commit, bumping the version (and so dropping cached results) unless
+       bump=False says the transaction changed no rows queries can see."""
+    if bump:
+        con.execute("""
+        INSERT INTO meta(key, value) VALUES('version', 1)
+        ON CONFLICT(key) DO UPDATE SET value=value+1
+        """)
+    con.commit()
+
+def _dirs_deleted(con):
+    """Note that dirs rows were deleted: their ids may be handed out again, so
+       readers drop the paths they memoized (see _DirMap)."""
+    con.execute("""
+    INSERT INTO meta(key, value) VALUES('dirs_epoch', 1)
+    ON CONFLICT(key) DO UPDATE SET value=value+1
+    """)
+
+def dir_paths(con):
+    """id -> full path for every row of dirs. Parents are always inserted
+       before their children, so one pass in id order resolves everything."""
+    paths = {}
+    for i, parent_id, name in con.execute("SELECT id, parent_id, name FROM dirs ORDER BY id"):
+        if parent_id == 0:
+            paths[i] = name
+        elif parent_id in paths:
+            paths[i] = os.path.join(paths[parent_id], name)
+    return paths
+
+class _DirIds:
+    """Maps folder paths to dirs.id for a writer connection through indexed
+       (parent_id, name) lookups, creating missing rows when asked to."""
+
+    def __init__(self, con, roots=(), gen=0):
+        self.con = con
+        self.gen = gen
+        self.roots = set(roots)
+        self.ids = {name: i for i, name in
+                    con.execute("SELECT id, name FROM dirs WHERE parent_id=0")}
+
+    def get(self, path, create=False):
+        i = self.ids.get(path)
+        if i is not None:
+            return i
+        if path in self.roots:
+            parent_id, name = 0, path
+        else:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None     # climbed past every root: not indexed
+            parent_id = self.get(parent, create)
+            if parent_id is None:
+                return None
+            name = os.path.basename(path)
+        row = self.con.execute("SELECT id FROM dirs WHERE parent_id=? AND name=?",
+                               (parent_id, name)).fetchone()
+        if row:
+            i = row[0]
+        elif create:
+            i = self.con.execute("INSERT INTO dirs(parent_id, name, gen) VALUES(?,?,?)",
+                                 (parent_id, name, self.gen)).lastrowid
+        else:
+            return None
+        self.ids[path] = i
+        return i
+
+def _crawl_dir(dirpath, dir_mtime, known, gen, timer=None):
+    """List one directory. Returns (message for the writer, subdirs to visit).
+       timer gets the listing ("walk") and stat time separately."""
+    clock = time.perf_counter
+    t0 = clock()
+    stat_s = 0.0
+    listed = stats = 0
+    if dir_mtime is None:
+        dir_mtime = os.stat(dirpath).st_mtime
+    unchanged = known.get(dirpath) == dir_mtime
+    rows = []
+    subdirs = []
+    with os.scandir(dirpath) as it:
+        for e in it:
+            listed += 1
+            try:
+                is_dir = e.is_dir(follow_symlinks=False)
+                if unchanged:
+                    # same entries as last pass: only subfolders need a stat
+                    if is_dir:
+                        ts = clock()
+                        subdirs.append((e.path, e.stat(follow_symlinks=False).st_mtime))
+                        stat_s += clock() - ts
+                        stats += 1
+                    continue
+                # DirEntry caches the stat (free on Windows, one lstat elsewhere)
+                ts = clock()
+                st = e.stat(follow_symlinks=False)
+                stat_s += clock() - ts
+                stats += 1
+            except OSError:
+                continue
+            rows.append((e.name, st.st_size, st.st_mtime))
+            if is_dir:
+                subdirs.append((e.path, st.st_mtime))
+    if timer is not None:
+        timer.add("walk", clock() - t0 - stat_s, listed)
+        timer.add("stat", stat_s, stats)
+    if unchanged:
+        return ("seen", dirpath, dir_mtime, None), subdirs
+    return ("scan", dirpath, dir_mtime, rows), subdirs
+
+def _crawl_worker(work_q, out_q, known, gen, abort, timer=None):
+    while True:
+        item = work_q.get()
+        try:
+            if item is None:
+                return
+            if abort.is_set():
+                continue
+            try:
+                msg, subdirs = _crawl_dir(item[0], item[1], known, gen, timer)
+            except OSError:
+                continue
+            for sub in subdirs:
+                work_q.put(sub)
+            out_q.put(msg)
+        finally:
+            work_q.task_done()
+
+def top_roots(roots):
+    """Absolute, deduplicated roots without any nested in another one (those
+       would be indexed twice)."""
+    roots = sorted(set(os.path.abspath(r) for r in roots))
+    return [r for r in roots
+            if not any(r.startswith(o.rstrip(os.sep) + os.sep) for o in roots if o != r)]
+
+def scan_roots(roots, progress_cb=None, stop_flag=None, incremental=False, db_path=None):
+    """Crawl roots and (up)sert into DB. Runs in worker thread.
+       SCAN_WORKERS threads pull directories from a shared queue and list them
+       with os.scandir, reusing the DirEntry stat data. This thread is the only
+       SQLite writer and consumes their results through a bounded queue.
+       Every pass gets a new generation number. A directory whose mtime matches
+       the one stored in `dirs` has the same entries as last time, so with
+       incremental=True its files are not stat'ed again (only its subfolders
+       are visited, and its row is not written). Rescanned directories drop rows
+       not seen in this pass, and once the walk completes, directories not seen
+       at all are swept along with their files. A pass that changed nothing
+       leaves the version alone, so cached results survive it. Note that a
+       file rewritten in place doesn't touch its directory's mtime: run a full
+       pass to refresh sizes/dates.
+       db_path: the index to write (a shard); DB_PATH by default.
+       Leaves an "index" record with entries/sec per phase: walk and stat
+       (summed over crawler threads), insert and commit (the writer), and
+       snapshot (rewriting <index>.snap once the pass is done)."""
+    db_path = _db(db_path)
+    con = sqlite3.connect(db_path)
+    cur = con.cursor()
+    gen = index_generation(con) + 1
+    start_version = index_version(con)
+    cur.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('generation', ?)", (gen,))
+    known = {}
+    if incremental:
+        paths = dir_paths(con)
+        for i, mtime in cur.execute("SELECT id, mtime FROM dirs"):
+            if i in paths:
+                known[paths[i]] = mtime
+    roots = top_roots(roots)
+    ids = _DirIds(con, roots, gen)
+    total = committed = removed = 0
+    dirs_scanned = dirs_seen = 0
+    seen = set()                # dirs.id of every folder this pass reached
+    timer = PhaseTimer()
+    clock = time.perf_counter
+    t0 = time.time()
+
+    def commit(bump=True):
+        nonlocal committed
+        tc = clock()
+        _commit(con, bump)
+        timer.add("commit", clock() - tc, total - committed)
+        committed = total
+
+    work_q = queue.Queue()
+    out_q = queue.Queue(maxsize=SCAN_QUEUE_MAX)
+    abort = threading.Event()
+    for root in roots:
+        work_q.put((root, None))
+    workers = [
+        threading.Thread(target=_crawl_worker, args=(work_q, out_q, known, gen, abort, timer),
+                         daemon=True)
+        for _ in range(SCAN_WORKERS)
+    ]
+    for w in workers:
+        w.start()
+
+    def _finish():
+        work_q.join()           # every queued directory (and its subdirs) handled
+        for _ in workers:
+            work_q.put(None)
+        out_q.put(None)
+    threading.Thread(target=_finish, daemon=True).start()
+
+    while True:
+        msg = out_q.get()
+        if msg is None:
+            break
+        if stop_flag and stop_flag.is_set():
+            abort.set()         # workers drain the queue; keep consuming until None
+            continue
+        kind, dirpath, dir_mtime, rows = msg
+        ti = clock()
+        dir_id = ids.get(dirpath, create=True)
+        seen.add(dir_id)
+        if kind == "seen":
+            timer.add("insert", clock() - ti)
+            dirs_seen += 1
+            continue
+        dirs_scanned += 1
+        if rows:
+            cur.executemany("""
+            INSERT INTO files(dir_id, name, size, mtime, gen, ext)
+            VALUES(?,?,?,?,?,?)
+            ON CONFLICT(dir_id, name) DO UPDATE SET
+                size=excluded.size,
+                mtime=excluded.mtime,
+                gen=excluded.gen
+            """, [(dir_id, n, size, mtime, gen, file_ext(n)) for n, size, mtime in rows])
+            total += len(rows)
+        # entries gone from this folder since the last pass
+        cur.execute("DELETE FROM files WHERE dir_id=? AND gen<?", (dir_id, gen))
+        removed += cur.rowcount
+        cur.execute("UPDATE dirs SET mtime=?, gen=? WHERE id=?", (dir_mtime, gen, dir_id))
+        timer.add("insert", clock() - ti, len(rows))
+
+        # a row count crossing, not total % N: batches rarely land on a multiple
+        if total - committed >= SCAN_COMMIT_ROWS:
+            commit()
+            if progress_cb:
+                progress_cb(total)
+
+    def finish(aborted):
+        dt = time.time() - t0
+        return record("index", db=str(db_path), roots=roots, incremental=incremental,
+                      aborted=aborted, entries=total, dirs_scanned=dirs_scanned,
+                      dirs_unchanged=dirs_seen, seconds=round(dt, 3),
+                      per_sec=round(total / dt) if dt > 0 else None, phases=timer.report())
+
+    if abort.is_set():
+        commit(bump=bool(total or removed or dirs_scanned))
+        con.close()
+        finish(True)
+        return
+
+    # sweep folders (and their files) that no longer exist or left the roots
+    ti = clock()
+    gone = [(i,) for i, in cur.execute("SELECT id FROM dirs") if i not in seen]
+    cur.executemany("DELETE FROM files WHERE dir_id=?", gone)
+    removed += cur.rowcount if gone else 0
+    cur.executemany("DELETE FROM dirs WHERE id=?", gone)
+    if gone:
+        _dirs_deleted(con)
+    timer.add("insert", clock() - ti)
+    changed = bool(total or removed or dirs_scanned or gone)
+    commit(bump=changed)
+    # nobody else wrote in between and no row changed: the snapshot still holds
+    quiet = not changed and index_version(con) == start_version
+    con.close()
+    ts = clock()
+    if not (quiet and restamp_snapshot(db_path, start_version)):
+        build_snapshot(db_path)
+    timer.add("snapshot", clock() - ts, total)
+    rec = finish(False)
+    if progress_cb:
+        progress_cb(total, done=True, seconds=rec["seconds"])
+
+def apply_changes(paths, db_path=None):
+    """Bring the rows for `paths` in line with the disk, in one transaction.
+       A path that still exists is (re)stat'ed and upserted; a path that is gone
+       is deleted together with everything indexed below it."""
+    if not paths:
+        return 0
+    con = sqlite3.connect(_db(db_path))
+    cur = con.cursor()
+    gen = index_generation(con)
+    ids = _DirIds(con, gen=gen)
+    for p in paths:
+        name = os.path.basename(p)
+        try:
+            st = os.stat(p, follow_symlinks=False)
+        except OSError:
+            st = None
+        # only a path that exists may create its missing parent folders
+        dir_id = ids.get(os.path.dirname(p), create=st is not None)
+        if dir_id is None:
+            continue            # outside the indexed roots, or already gone
+        if st is None:
+            sub = ids.get(p)
+            if sub is not None:
+                cur.execute("""
+                WITH RECURSIVE t(id) AS (
+                    SELECT ? UNION ALL SELECT d.id FROM dirs d JOIN t ON d.parent_id = t.id
+                )
+                SELECT id FROM t
+                """, (sub,))
+                gone = {i for i, in cur.fetchall()}
+                cur.executemany("DELETE FROM files WHERE dir_id=?", [(i,) for i in gone])
+                cur.executemany("DELETE FROM dirs WHERE id=?", [(i,) for i in gone])
+                _dirs_deleted(con)
+                ids.ids = {k: v for k, v in ids.ids.items() if v not in gone}
+            cur.execute("DELETE FROM files WHERE dir_id=? AND name=?", (dir_id, name))
+            continue
+        cur.execute("""
+        INSERT INTO files(dir_id, name, size, mtime, gen, ext)
+        VALUES(?,?,?,?,?,?)
+        ON CONFLICT(dir_id, name) DO UPDATE SET
+            size=excluded.size,
+            mtime=excluded.mtime
+        """, (dir_id, name, st.st_size, st.st_mtime, gen, file_ext(name)))
+    _commit(con)
+    con.close()
+    return len(paths)
+
+# inotify(7)
+IN_MODIFY      = 0x00000002
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_ONLYDIR     = 0x01000000
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+IN_WATCH_MASK  = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+                  IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR)
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+class InotifyWatcher(threading.Thread):
+    """Linux backend: one inotify watch per indexed folder. Events are
+       coalesced into a set of dirty paths and handed to apply_changes every
+       WATCH_BATCH_MS. A queue overflow falls back to an incremental rescan
+       followed by watching the folders created meanwhile; while the watch
+       limit keeps that from succeeding, the rescan repeats every
+       WATCH_POLL_SECONDS as with PollingWatcher. Once changes stop for
+       SNAPSHOT_DELAY_SECONDS the snapshot is rewritten."""
+
+    def __init__(self, roots, on_change=None, db_path=None):
+        super().__init__(daemon=True)
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.on_change = on_change
+        self.db_path = db_path
+        self._stop_evt = threading.Event()
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wd_path = {}
+        self._overflowed = False
+        self._poll_due = None           # set while some folders have no watch
+        try:
+            for r in self.roots:
+                self._watch_tree(r)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _watch_tree(self, top, dirty=None):
+        """Watch top and every folder below it; collect entries into dirty."""
+        stack = [top]
+        while stack:
+            d = stack.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(d), IN_WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == 28:  # ENOSPC: max_user_watches exhausted
+                    raise OSError(err, "inotify watch limit reached")
+                continue
+            self._wd_path[wd] = d
+            try:
+                with os.scandir(d) as it:
+                    for e in it:
+                        if dirty is not None:
+                            dirty.add(e.path)
+                        if e.is_dir(follow_symlinks=False):
+                            stack.append(e.path)
+            except OSError:
+                continue
+
+    def _watch_missing(self):
+        """Watch every folder under the roots that has no watch yet."""
+        watched = set(self._wd_path.values())
+        stack = list(self.roots)
+        while stack:
+            d = stack.pop()
+            if d not in watched:
+                self._watch_tree(d)     # new folder: everything below it is new too
+                continue
+            try:
+                with os.scandir(d) as it:
+                    stack += [e.path for e in it if e.is_dir(follow_symlinks=False)]
+            except OSError:
+                continue
+
+    def _catch_up(self):
+        """Events were dropped: rescan, then watch folders that appeared in the
+           meantime. True if the index changed."""
+        with read_connection(self.db_path) as con:
+            before = index_version(con)
+        scan_roots(self.roots, stop_flag=self._stop_evt, incremental=True, db_path=self.db_path)
+        try:
+            self._watch_missing()
+            self._poll_due = None
+        except OSError:
+            # still out of watches: unwatched folders are only seen by polling
+            self._poll_due = time.time() + WATCH_POLL_SECONDS
+        with read_connection(self.db_path) as con:
+            return index_version(con) != before
+
+    def _unwatch_tree(self, top):
+        eq, lo, hi = top, top + os.sep, top + chr(ord(os.sep) + 1)
+        for wd, d in list(self._wd_path.items()):
+            if d == eq or lo <= d < hi:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                self._wd_path.pop(wd, None)
+
+    def stop(self):
+        self._stop_evt.set()
+
+    def run(self):
+        dirty = set()
+        deadline = None
+        snapshot_due = None             # watcher batches leave the snapshot stale
+        try:
+            while not self._stop_evt.is_set():
+                timeout = 0.5 if deadline is None else max(0.0, deadline - time.time())
+                ready, _, _ = select.select([self._fd], [], [], timeout)
+                if ready:
+                    try:
+                        buf = os.read(self._fd, 64 * 1024)
+                    except BlockingIOError:
+                        buf = b""
+                    if self._parse(buf, dirty) and deadline is None:
+                        deadline = time.time() + WATCH_BATCH_MS / 1000.0
+                if deadline is not None and time.time() >= deadline:
+                    batch, dirty, deadline = dirty, set(), None
+                    if self._overflowed:
+                        # events were dropped: let an incremental pass catch up
+                        self._overflowed = False
+                        n = int(self._catch_up())
+                    else:
+                        n = apply_changes(batch, self.db_path)
+                        snapshot_due = time.time() + SNAPSHOT_DELAY_SECONDS
+                    if n and self.on_change:
+                        self.on_change(n)
+                if self._poll_due is not None and deadline is None and time.time() >= self._poll_due:
+                    if self._catch_up() and self.on_change:
+                        self.on_change(1)
+                if snapshot_due is not None and deadline is None and time.time() >= snapshot_due:
+                    snapshot_due = None
+                    build_snapshot(self.db_path)
+        finally:
+            os.close(self._fd)
+
+    def _parse(self, buf, dirty):
+        """Fold raw inotify events into dirty. True if anything changed."""
+        off = 0
+        changed = False
+        while off + _INOTIFY_EVENT.size <= len(buf):
+            wd, mask, _cookie, ln = _INOTIFY_EVENT.unpack_from(buf, off)
+            off += _INOTIFY_EVENT.size
+            name = buf[off:off + ln].split(b"\0", 1)[0]
+            off += ln
+            if mask & IN_Q_OVERFLOW:
+                self._overflowed = changed = True
+                continue
+            if mask & IN_IGNORED:
+                self._wd_path.pop(wd, None)
+                continue
+            d = self._wd_path.get(wd)
+            if d is None or not name:
+                continue
+            p = os.path.join(d, os.fsdecode(name))
+            dirty.add(p)
+            changed = True
+            if mask & IN_ISDIR:
+                if mask & (IN_MOVED_FROM | IN_DELETE):
+                    self._unwatch_tree(p)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    # a new or moved-in folder: index and watch its subtree
+                    try:
+                        self._watch_tree(p, dirty)
+                    except OSError:
+                        self._overflowed = True
+        return changed
+
+class PollingWatcher(threading.Thread):
+    """Fallback backend: an incremental scan_roots every WATCH_POLL_SECONDS.
+       Only folders whose mtime moved are re-listed, so an idle tree costs one
+       stat per folder per interval."""
+
+    def __init__(self, roots, on_change=None, interval=WATCH_POLL_SECONDS, db_path=None):
+        super().__init__(daemon=True)
+        self.roots = list(roots)
+        self.on_change = on_change
+        self.db_path = db_path
+        self.interval = interval
+        self._stop_evt = threading.Event()
+
+    def stop(self):
+        self._stop_evt.set()
+
+    def run(self):
+        while not self._stop_evt.wait(self.interval):
+            changed = []
+            def progress(count, done=False, seconds=None):
+                if done:
+                    changed.append(count)
+            scan_roots(self.roots, progress_cb=progress, stop_flag=self._stop_evt, incremental=True,
+                       db_path=self.db_path)
+            if changed and changed[0] and self.on_change:
+                self.on_change(changed[0])
+
+def start_watcher(roots, on_change=None, db_path=None):
+    """Start the best available watcher for roots: inotify on Linux, polling
+       elsewhere (or when inotify can't be set up)."""
+    w = None
+    if sys.platform.startswith("linux"):
+        try:
+            w = InotifyWatcher(roots, on_change, db_path=db_path)
+        except (OSError, AttributeError):
+            w = None
+    if w is None:
+        w = PollingWatcher(roots, on_change, db_path=db_path)
+    w.start()
+    return w
+
+# --- shards: one index file per root
+# Every root gets its own SQLite file, so roots are crawled, watched and
+# rebuilt independently (a slow network share never holds a local disk's
+# writer lock) and queries fan out to all shards at once. Shards are queried
+# side by side rather than ATTACHed: SQLite caps a connection at 10 attached
+# databases by default, and one connection would serialize the work anyway.
+SHARD_QUERY_WORKERS = 16            # shards searched concurrently
+
+def shard_path(root):
+    """Index file for one root: DB_DIR/shards/<readable name>-<hash>.db"""
+    root = os.path.abspath(root)
+    slug = re.sub(r"[^\w.-]+", "_", root).strip("_")[-48:] or "root"
+    digest = hashlib.sha1(os.path.normcase(root).encode("utf-8")).hexdigest()[:8]
+    return DB_DIR / "shards" / f"{slug}-{digest}.db"
+
+def init_shards(roots):
+    for root in top_roots(roots):
+        init_db(shard_path(root)).close()
+
+def scan_shards(roots, progress_cb=None, stop_flag=None, incremental=False):
+    """scan_roots for every root into its own shard, all at once. progress_cb
+       sees the summed entry count, and done=True once every shard finished
+       (not at all when stop_flag aborted the pass, like scan_roots)."""
+    roots = top_roots(roots)
+    counts = dict.fromkeys(roots, 0)
+    finished = []
+    lock = threading.Lock()
+    t0 = time.time()
+
+    def scan(root):
+        def progress(count, done=False, seconds=None):
+            with lock:
+                counts[root] = count
+                if done:
+                    finished.append(root)
+                total = sum(counts.values())
+            if progress_cb and not done:
+                progress_cb(total)
+        init_db(shard_path(root)).close()
+        scan_roots([root], progress, stop_flag, incremental, db_path=shard_path(root))
+
+    threads = [threading.Thread(target=scan, args=(r,), daemon=True) for r in roots]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if progress_cb and len(finished) == len(roots):
+        progress_cb(sum(counts.values()), done=True, seconds=time.time() - t0)
+
+class ShardWatchers(list):
+    """One watcher per shard, stopped together."""
+
+    def stop(self):
+        for w in self:
+            w.stop()
+
+def start_shard_watchers(roots, on_change=None):
+    return ShardWatchers(start_watcher([r], on_change, db_path=shard_path(r))
+                         for r in top_roots(roots))
+
+def shard_entries(roots):
+    """Indexed entries over every root's shard (0 for shards not built yet)."""
+    n = 0
+    for root in top_roots(roots):
+        db = shard_path(root)
+        if db.exists():
+            with read_connection(db) as con:
+                snap = snapshot_for(db, index_version(con))
+                n += snap.files if snap else con.execute("SELECT COUNT(1) FROM files").fetchone()[0]
+    return n
+
+def is_regex(pattern):
+    return len(pattern) >= 2 and pattern.startswith("/") and pattern.endswith("/")
+
+def is_plain(pattern):
+    """No glob or regex syntax: the pattern is a plain substring."""
+    return not is_regex(pattern) and not re.search(r"[\*\?\[]", pattern)
+
+def wildcard_to_regex(pattern):
+    # Convert * and ? to regex; allow plain substring if no wildcard
+    if not pattern:
+        return None
+    if is_plain(pattern):
+        return re.compile(re.escape(pattern), re.IGNORECASE)
+    # If user typed /regex/... allow true regex
+    if is_regex(pattern):
+        try:
+            return re.compile(pattern[1:-1], re.IGNORECASE)
+        except re.error:
+            return None
+    # Else turn glob into regex
+    rx = fnmatch.translate(pattern)
+    return re.compile(rx, re.IGNORECASE)
+
+def glob_literals(pattern):
+    """Literal runs of a glob: '*core?.py' -> ['core', '.py']."""
+    return [s for s in re.split(r"\[[^\]]*\]|[\*\?]+", pattern) if s]
+
+def regex_literals(body):
+    """Substrings any match of the regex must contain, as AND-ed clauses of
+       OR-ed literals: 'foo(bar|baz)\\d+' -> [['foo'], ['bar', 'baz']].
+       Lowercased; [] when nothing is required or the regex doesn't parse."""
+    try:
+        return _required(sre_parse.parse(body, re.IGNORECASE))
+    except (re.error, RecursionError):
+        return []
+
+def _required(seq):
+    c = sre_constants
+    clauses = []
+    run = []
+    for op, av in seq:
+        if op is c.LITERAL:
+            run.append(chr(av).lower())
+            continue
+        if run:
+            clauses.append(["".join(run)])
+            run = []
+        if op is c.SUBPATTERN:
+            clauses += _required(av[-1])
+        elif op in (c.MAX_REPEAT, c.MIN_REPEAT) and av[0] >= 1:
+            clauses += _required(av[2])
+        elif op is c.BRANCH:
+            # one literal from every alternative, or no constraint at all
+            alts = set()
+            for alt in av[1]:
+                singles = [cl[0] for cl in _required(alt) if len(cl) == 1]
+                if not singles:
+                    alts = None
+                    break
+                alts.add(max(singles, key=len))
+            if alts:
+                clauses.append(sorted(alts))
+    if run:
+        clauses.append(["".join(run)])
+    return clauses
+
+@functools.lru_cache(maxsize=64)
+def _compiled(pattern):
+    return re.compile(pattern, re.IGNORECASE)
+
+def _regexp(pattern, value):
+    """SQLite REGEXP: lets the final regex match run inside the engine."""
+    return value is not None and _compiled(pattern).search(value) is not None
+
+# --- Everything-style search syntax
+#   ext:py;txt   size:>100mb  size:1kb..2mb  size:empty
+#   dm:today  dm:yesterday  dm:last7days  dm:thisweek  dm:>2025-01-31  dm:2025-01..2025-03
+#   parent:src   NOT x / !x   a OR b / a | b   (AND is implicit between terms)
+OPERATORS = ("ext", "size", "dm", "parent")
+SIZE_UNITS = {"": 1, "b": 1, "kb": 1 << 10, "mb": 1 << 20, "gb": 1 << 30, "tb": 1 << 40}
+
+class QuerySyntaxError(ValueError):
+    """A structured search term that can't be compiled."""
+
+# [!][op:]"quoted value" (the closing quote may still be missing while typing)
+# or a bare word
+_TOKEN_RX = re.compile(r'(!?)(?:(?:(%s):)?"([^"]*)(?:"|$)|(\S+))' % "|".join(OPERATORS),
+                       re.IGNORECASE)
+_OP_RX = re.compile(r"(%s):(.*)$" % "|".join(OPERATORS), re.IGNORECASE)
+
+def parse_query(text):
+    """Split Everything-style search text into OR-ed groups of AND-ed terms,
+       each (negated, operator or None, value). Returns None for a plain
+       pattern (no operator, quote or OR/NOT), which keeps the fast path.
+       Quotes keep spaces in a value: parent:"Program Files", "my file".
+       Empty OR branches are dropped; a NOT with nothing after it, or no term
+       at all ('!', 'OR'), is a QuerySyntaxError."""
+    groups = [[]]
+    structured = False
+    negate = False
+    for m in _TOKEN_RX.finditer(text):
+        bang, quoted_op, quoted, word = m.groups()
+        if quoted is None and word in ("OR", "|"):
+            groups.append([])
+            structured = True
+            continue
+        if quoted is None and word in ("NOT", "!"):
+            negate = structured = True
+            continue
+        if quoted is None and word == "AND":
+            structured = True
+            continue
+        neg = negate or bool(bang)
+        structured = structured or bool(bang) or quoted is not None
+        negate = False
+        if quoted_op:
+            groups[-1].append((neg, quoted_op.lower(), quoted))
+            continue
+        op = _OP_RX.match(word) if quoted is None else None
+        if op:
+            structured = True
+            groups[-1].append((neg, op.group(1).lower(), op.group(2)))
+        else:
+            groups[-1].append((neg, None, quoted if quoted is not None else word))
+    if not structured:
+        return None
+    if negate:
+        raise QuerySyntaxError("NOT needs a term after it")
+    groups = [g for g in groups if g]
+    if not groups:
+        raise QuerySyntaxError("no search terms")
+    return groups
+
+def is_structured(pattern):
+    try:
+        return parse_query(pattern) is not None
+    except QuerySyntaxError:
+        return True             # broken, but it goes down the structured path to say so
+
+def parse_size(v):
+    """'100mb' -> 104857600; a bare unit letter ('10k') means kb."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(b?)\s*", v.lower())
+    if not m:
+        raise QuerySyntaxError(f"bad size: {v!r}")
+    unit = m.group(2) + "b" if m.group(2) else m.group(3)
+    return int(float(m.group(1)) * SIZE_UNITS[unit])
+
+def _day(t):
+    return datetime(t.year, t.month, t.day)
+
+def parse_date_range(v, now=None):
+    """dm: value -> (lo, hi) epoch bounds, either may be None; hi is exclusive."""
+    now = now or datetime.now()
+    today = _day(now)
+    v = v.lower()
+    named = {
+        "today":     (today, None),
+        "yesterday": (today - timedelta(days=1), today),
+        "thisweek":  (today - timedelta(days=today.weekday()), None),
+        "thismonth": (today.replace(day=1), None),
+        "thisyear":  (today.replace(month=1, day=1), None),
+    }
+    if v in named:
+        lo, hi = named[v]
+        return lo.timestamp(), hi.timestamp() if hi else None
+    m = re.fullmatch(r"last(\d+)(min|mins|hour|hours|day|days|week|weeks)", v)
+    if m:
+        unit = {"min": "minutes", "hour": "hours", "day": "days", "week": "weeks"}[m.group(2).rstrip("s")]
+        return (now - timedelta(**{unit: int(m.group(1))})).timestamp(), None
+    for prefix in (">=", "<=", ">", "<"):
+        if v.startswith(prefix):
+            lo, hi = _date_span(v[len(prefix):])
+            return {">=": (lo, None), ">": (hi, None), "<=": (None, hi), "<": (None, lo)}[prefix]
+    if ".." in v:
+        a, b = v.split("..", 1)
+        return _date_span(a)[0], _date_span(b)[1]
+    return _date_span(v)
+
+def _date_span(v):
+    """'2025', '2025-03' or '2025-03-14' -> (start, end) of that year/month/day."""
+    for fmt, step in (("%Y-%m-%d", "day"), ("%Y-%m", "month"), ("%Y", "year")):
+        try:
+            start = datetime.strptime(v.strip(), fmt)
+        except ValueError:
+            continue
+        if step == "day":
+            end = start + timedelta(days=1)
+        elif step == "month":
+            end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        else:
+            end = start.replace(year=start.year + 1)
+        return start.timestamp(), end.timestamp()
+    raise QuerySyntaxError(f"bad date: {v!r}")
+
+def _term_sql(op, value, subject, in_path, db_path):
+    """One search term -> (SQL predicate, params)."""
+    if op is None:
+        rx = wildcard_to_regex(value)
+        if rx is None:
+            raise QuerySyntaxError(f"bad pattern: {value!r}")
+        lead = [os.sep] if in_path else []
+        if is_regex(value):
+            return f"{subject} REGEXP ?", lead + [rx.pattern]
+        # cheap LIKE first, exact REGEXP on what survives
+        like = "%" + "%".join(l.lower() for l in glob_literals(value)) + "%"
+        if not like.isascii():
+            return f"{subject} REGEXP ?", lead + [rx.pattern]
+        return f"({subject} LIKE ? AND {subject} REGEXP ?)", lead + [like] + lead + [rx.pattern]
+    if op == "ext":
+        exts = [e.strip().lstrip(".").lower() for e in value.split(";") if e.strip()]
+        if not exts:
+            raise QuerySyntaxError("ext: needs a value")
+        return f"ext IN ({','.join('?' * len(exts))})", exts
+    if op == "size":
+        v = value.strip().lower()
+        if v == "empty":
+            return "size = 0", []
+        for prefix, cmp in ((">=", ">="), ("<=", "<="), (">", ">"), ("<", "<"), ("=", "=")):
+            if v.startswith(prefix):
+                return f"size {cmp} ?", [parse_size(v[len(prefix):])]
+        if ".." in v:
+            a, b = v.split("..", 1)
+            return "size BETWEEN ? AND ?", [parse_size(a), parse_size(b)]
+        return "size = ?", [parse_size(v)]
+    if op == "dm":
+        lo, hi = parse_date_range(value)
+        conds, params = [], []
+        if lo is not None:
+            conds.append("mtime >= ?")
+            params.append(lo)
+        if hi is not None:
+            conds.append("mtime < ?")
+            params.append(hi)
+        return "(" + " AND ".join(conds or ["1"]) + ")", params
+    if op == "parent":
+        if not value:
+            raise QuerySyntaxError("parent: needs a value")
+        return ("dir_id IN (SELECT value FROM json_each(?))",
+                [json.dumps(_dirs_containing(value, db_path))])
+    raise QuerySyntaxError(f"unknown operator: {op}")
+
+def compile_query(groups, in_path=False, db_path=None):
+    """parse_query groups -> (SQL predicate, params). Everything is decided in
+       SQL, so size/dm/ext terms can use their indexes."""
+    subject = "dirpath(dir_id) || ? || name" if in_path else "name"
+    ors, params = [], []
+    for group in groups:
+        ands = []
+        for neg, op, value in group:
+            sql, ps = _term_sql(op, value, subject, in_path, _db(db_path))
+            ands.append(f"NOT {sql}" if neg else sql)
+            params += ps
+        ors.append("(" + " AND ".join(ands) + ")")
+    return "(" + " OR ".join(ors) + ")", params
+
+def query_clauses(groups):
+    """Trigram clauses implied by a single AND group's positive name terms."""
+    if len(groups) != 1:
+        return []
+    clauses = []
+    for neg, op, value in groups[0]:
+        if neg or op is not None:
+            continue
+        if is_regex(value):
+            clauses += regex_literals(value[1:-1])
+        else:
+            clauses += [[lit.lower()] for lit in glob_literals(value)]
+    return clauses
+
+def trigram_match(clauses, column):
+    """FTS5 MATCH expression requiring every clause (a list of alternative
+       literals) in column. Clauses with a literal under 3 chars can't use
+       the trigram index and are left out; None if nothing is left."""
+    terms = []
+    for alts in clauses:
+        if alts and all(len(lit) >= TRIGRAM_MIN for lit in alts):
+            ors = [f'{column} : "{lit.replace(chr(34), chr(34) * 2)}"' for lit in alts]
+            terms.append(ors[0] if len(ors) == 1 else "(" + " OR ".join(ors) + ")")
+    return " AND ".join(terms) if terms else None
+
+# sortable result columns -> ORDER BY on raw, indexed columns
+ORDER_BY = {
+    "name":   "name COLLATE NOCASE",
+    "folder": "dirpath(dir_id), name COLLATE NOCASE",
+    "size":   "size",
+    "mtime":  "mtime",
+}
+
+# Folder paths for the query side. Rows only carry dir_id; full paths are
+# resolved for the rows that get displayed (and through the dirpath() SQL
+# function on reader connections) by walking parent_id, and memoized. A dirs
+# row's parent and name never change, so index writes don't invalidate the
+# memo; only deleted folders do, because SQLite may reuse their ids.
+class _DirMap:
+    def __init__(self):
+        self.paths = {}             # dir id -> full path, for ids resolved so far
+        self.epoch = None           # meta dirs_epoch the memo is valid for
+        self.lock = threading.Lock()
+
+    def sync(self, con):
+        row = con.execute("SELECT value FROM meta WHERE key='dirs_epoch'").fetchone()
+        epoch = int(row[0]) if row else 0
+        if epoch != self.epoch:
+            with self.lock:
+                self.paths = {}
+                self.epoch = epoch
+        return self
+
+    def path(self, con, i):
+        """Full path of folder i ('' if it no longer exists)."""
+        paths = self.paths
+        p = paths.get(i)
+        if p is not None:
+            return p
+        chain = []
+        while i and i not in paths:
+            row = con.execute("SELECT parent_id, name FROM dirs WHERE id=?", (i,)).fetchone()
+            if row is None:
+                return ""
+            chain.append((i, row[1]))
+            i = row[0]
+        p = paths.get(i) if i else None
+        for j, name in reversed(chain):
+            p = name if p is None else os.path.join(p, name)
+            paths[j] = p
+        return p
+
+_dir_maps = {}                      # db path -> _DirMap
+_dir_map_lock = threading.Lock()
+
+def _dir_map(db_path):
+    with _dir_map_lock:
+        return _dir_maps.setdefault(db_path, _DirMap())
+
+def _load_dirs(con, db_path):
+    return _dir_map(db_path).sync(con)
+
+def _dirs_containing(sub, db_path):
+    """Ids of folders whose full path contains sub (case-insensitive), found in
+       SQL: the shallowest folder of a matching path has sub's last component in
+       its own name (or is a root, whose name is a whole path), so those are
+       checked against their full path and expanded to their subtrees."""
+    seps = os.sep + (os.altsep or "")
+    sub = sub.lower().rstrip(seps)
+    if os.altsep:
+        sub = sub.replace(os.altsep, os.sep)
+    last = sub.rsplit(os.sep, 1)[-1]
+    name = "lower(name)" if last.isascii() else "py_lower(name)"
+    with read_connection(db_path) as con:
+        dirs = _load_dirs(con, db_path)
+        seeds = [i for i, in con.execute(
+                     f"SELECT id FROM dirs WHERE parent_id = 0 OR instr({name}, ?) > 0", (last,))
+                 if sub in dirs.path(con, i).lower()]
+        if not seeds:
+            return []
+        return [i for i, in con.execute("""
+        WITH RECURSIVE t(id) AS (
+            SELECT value FROM json_each(?) UNION SELECT d.id FROM dirs d JOIN t ON d.parent_id = t.id
+        )
+        SELECT id FROM t
+        """, (json.dumps(seeds),))]
+
+class QueryCancelled(Exception):
+    """A newer search superseded this one."""
+
+_query_cache = collections.OrderedDict()   # (pattern, in_path, parent_filter, order) -> entry
+_query_cache_lock = threading.Lock()
+
+def _substring_of(pattern):
+    """The substring every match must contain when pattern is 'x' or '*x*',
+       else None (globs with anchors or ?/[] don't narrow simply)."""
+    if is_plain(pattern):
+        return pattern.lower()
+    if len(pattern) > 2 and pattern[0] == pattern[-1] == "*" and is_plain(pattern[1:-1]):
+        return pattern[1:-1].lower()
+    return None
+
+def _narrows(pattern, parent_filter, old_pattern, old_parent):
+    """True when every match of (pattern, parent_filter) is also a match of
+       the cached (old_pattern, old_parent)."""
+    if old_parent and (not parent_filter or old_parent.lower() not in parent_filter.lower()):
+        return False
+    if is_structured(pattern) or is_structured(old_pattern):
+        return False
+    old = _substring_of(old_pattern)
+    if old is None or is_regex(pattern):
+        return False
+    # any glob match contains each of its literal runs
+    return any(old in lit.lower() for lit in glob_literals(pattern))
+
+def query_db(pattern, in_path=False, limit=RESULT_LIMIT, parent_filter=None, cancel=None,
+             order_by=None, descending=False, db_path=None, stats=None):
+    """query_db_uncached behind an LRU cache keyed by (pattern, in_path,
+       parent_filter, order) and invalidated by index_version. When the pattern only
+       narrows a cached, untruncated result (typing 'repo' then 'repor'), the
+       answer is filtered in memory without touching SQLite, and a plain
+       substring with a current snapshot is answered by scanning that.
+       cancel: optional callable; once it returns True the search stops with
+       QueryCancelled. db_path picks the index (a shard); see query_shards.
+       Leaves a "query" record: where the answer came from (cache, narrowed,
+       sql), SQL and Python filter seconds, rows examined and returned; the
+       same fields go into the stats dict when one is passed."""
+    db_path = _db(db_path)
+    t0 = time.perf_counter()
+    info = {"source": "cache", "sql_s": 0.0, "filter_s": 0.0, "examined": 0}
+    with read_connection(db_path) as con:
+        version = index_version(con)
+    order = (order_by, descending)
+    key = (db_path, pattern, in_path, parent_filter, order)
+    with _query_cache_lock:
+        hit = _query_cache.get(key)
+        base = None
+        if hit and hit[0] == version and hit[1] == limit:
+            _query_cache.move_to_end(key)
+            out = list(hit[3])
+        else:
+            hit = None
+            for (db, p, ip, pf, o), (v, lim, truncated, rows) in reversed(_query_cache.items()):
+                if db == db_path and v == version and lim == limit and ip == in_path \
+                        and o == order and not truncated \
+                        and _narrows(pattern, parent_filter, p, pf):
+                    base = rows
+                    break
+
+    snap = None
+    if not hit and base is None and snapshot_can_answer(pattern, in_path, order_by):
+        snap = snapshot_for(db_path, version)
+    if hit:
+        pass                    # exact repeat: nothing to recompute
+    elif base is not None:
+        tf = time.perf_counter()
+        rx = wildcard_to_regex(pattern)
+        pf = parent_filter.lower() if parent_filter else None
+        out = [r for r in base
+               if (rx is None or rx.search(r[0] if in_path else r[1]))
+               and (pf is None or pf in r[2].lower())]
+        truncated = False
+        info.update(source="narrowed", filter_s=time.perf_counter() - tf, examined=len(base))
+    elif snap is not None:
+        tf = time.perf_counter()
+        out, examined = snap.search(pattern, limit, parent_filter, cancel)
+        truncated = len(out) >= limit
+        info.update(source="snapshot", filter_s=time.perf_counter() - tf, examined=examined)
+    else:
+        info["source"] = "sql"
+        out, truncated = query_db_uncached(pattern, in_path, limit, parent_filter,
+                                           with_truncated=True, cancel=cancel,
+                                           order_by=order_by, descending=descending,
+                                           db_path=db_path, stats=info)
+    info.update(returned=len(out), seconds=time.perf_counter() - t0)
+    if stats is not None:
+        stats.update(info)
+    record("query", db=str(db_path), pattern=pattern, in_path=in_path,
+           parent_filter=parent_filter, order_by=order_by,
+           **{k: round(v, 6) if isinstance(v, float) else v for k, v in info.items()})
+    if hit:
+        return out
+
+    with _query_cache_lock:
+        _query_cache[key] = (version, limit, truncated, out)
+        _query_cache.move_to_end(key)
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+    return list(out)
+
+def query_db_uncached(pattern, in_path=False, limit=RESULT_LIMIT, parent_filter=None,
+                      with_truncated=False, cancel=None, order_by=None, descending=False,
+                      db_path=None, stats=None):
+    """Search by wildcard/regex. SQLite used for coarse prefilter, Python for final match.
+       Literals of 3+ chars go through the files_tri trigram index, so the prefilter
+       only touches rows that contain them instead of scanning the whole table.
+       order_by (a key of ORDER_BY) sorts in SQL on the raw columns, so the first
+       `limit` rows are the first in that order.
+       Search text using operators (ext:, size:, dm:, parent:) or OR/NOT is
+       compiled by compile_query into one parameterized WHERE clause.
+       stats (a dict) gets sql_s, filter_s and rows examined by the filter.
+       Returns mtime in ISO 8601 format (e.g., 2025-09-12T21:15:30)."""
+
+    groups = parse_query(pattern)
+    rx = wildcard_to_regex(pattern) if groups is None else None
+    regex = is_regex(pattern)
+    if groups is None and regex and rx is None:
+        raise QuerySyntaxError(f"bad regex: {pattern!r}")
+    if groups is not None:
+        clauses = query_clauses(groups)
+        like_tokens = []
+    elif regex:
+        clauses = regex_literals(pattern[1:-1])
+        # required literals, in no particular order
+        like_tokens = [f"%{alts[0]}%" for alts in clauses if len(alts) == 1]
+    else:
+        clauses = [[lit.lower()] for lit in glob_literals(pattern)]
+        # literals in order, anything in between
+        like_tokens = ["%" + "%".join(alts[0] for alts in clauses) + "%"] if clauses else []
+    # LIKE only folds ASCII case; leave non-ASCII tokens to trigram + regex
+    like_tokens = [t for t in like_tokens if t.isascii()]
+    base_sql = "SELECT dir_id, name, size, mtime FROM files"
+    where = []
+    params = []
+
+    db_path = _db(db_path)
+    with read_connection(db_path) as con:
+        dirs = _load_dirs(con, db_path)
+
+    if not in_path:
+        match = trigram_match(clauses, "name")
+        if match:
+            where.append("id IN (SELECT rowid FROM files_tri WHERE files_tri MATCH ?)")
+            params.append(match)
+    else:
+        # a separator-free piece of a literal lies within one path component, so
+        # it is either in the folder's path or in the name
+        singles = [alts[0] for alts in clauses if len(alts) == 1]
+        longest = max((piece for l in singles for piece in l.split(os.sep)), key=len, default="")
+        match = trigram_match([[longest]], "name")
+        if match:
+            where.append("(dir_id IN (SELECT value FROM json_each(?))"
+                         " OR id IN (SELECT rowid FROM files_tri WHERE files_tri MATCH ?))")
+            params += [json.dumps(_dirs_containing(longest, db_path)), match]
+
+    if parent_filter:
+        # resolve the folder filter to dir ids, then it's an indexed lookup
+        where.append("dir_id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(_dirs_containing(parent_filter, db_path)))
+
+    subject = "dirpath(dir_id) || ? || name" if in_path else "name"
+    for tok in like_tokens:
+        where.append(f"{subject} LIKE ?")
+        params += [os.sep, tok] if in_path else [tok]
+    fetch = limit * 4           # fetch more for final regex filter
+    if groups is not None:
+        pred, ps = compile_query(groups, in_path, db_path)
+        where.append(pred)
+        params += ps
+        fetch = limit
+    elif regex and rx is not None:
+        # final match in the engine: LIMIT then counts real hits only
+        where.append(f"{subject} REGEXP ?")
+        params += [os.sep, rx.pattern] if in_path else [rx.pattern]
+        fetch = limit
+
+    sql = base_sql + (" WHERE " + " AND ".join(where) if where else "")
+    if order_by:
+        direction = " DESC" if descending else ""
+        sql += " ORDER BY " + ", ".join(c + direction for c in ORDER_BY[order_by].split(", "))
+    sql += " LIMIT ?"
+    params.append(fetch)
+
+    t_sql = time.perf_counter()
+    with read_connection(db_path) as con:
+        if cancel:
+            # SQLite polls this every N VM steps; non-zero aborts the statement
+            con.set_progress_handler(lambda: 1 if cancel() else 0, 10000)
+        try:
+            rows = con.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            if cancel and cancel():
+                raise QueryCancelled()
+            raise
+        finally:
+            if cancel:
+                con.set_progress_handler(None, 0)
+
+    t_filter = time.perf_counter()
+    out = []
+    with read_connection(db_path) as con:
+        for i, (dir_id, n, size, mtime) in enumerate(rows):
+            if cancel and i % 4096 == 0 and cancel():
+                raise QueryCancelled()
+            if not in_path and rx is not None and not rx.search(n):
+                continue        # the name decides: don't resolve its folder
+            parent = dirs.path(con, dir_id)
+            p = os.path.join(parent, n)
+            if in_path and rx is not None and not rx.search(p):
+                continue
+            try:
+                iso_mtime = datetime.fromtimestamp(mtime).isoformat(timespec="seconds")
+            except Exception:
+                iso_mtime = ""
+            out.append((p, n, parent, size, iso_mtime))
+            if len(out) >= limit:
+                break
+    if stats is not None:
+        stats.update(sql_s=t_filter - t_sql, filter_s=time.perf_counter() - t_filter,
+                     examined=len(rows))
+    if with_truncated:
+        # rows may be missing if either the prefilter or the final cap was hit
+        return out, len(rows) >= fetch or len(out) >= limit
+    return out
+    
+
+
+# --- snapshot: packed, memory-mapped copy of the names
+# <index>.snap holds every file row as columns: dir ids, sizes, mtimes, name
+# offsets + one NUL-separated name blob (as typed and lowercased), and the
+# folder paths the same way. It is written after each index pass and mapped
+# read-only, so plain substring searches run as mmap.find over the lowered
+# blob: no SQLite pages to warm up, no copy of the data into Python.
+SNAPSHOT_MAGIC = b"PYEVSNP1"
+SNAPSHOT_SECTIONS = ("dir", "size", "mtime", "name_off", "names", "lower_off", "lower",
+                     "dir_ids", "dir_off", "dir_paths")
+_SNAP_HEAD = struct.Struct("<8sqqqq")   # magic, index version, generation, files, dirs
+_SNAP_TABLE = struct.Struct("<" + "QQ" * len(SNAPSHOT_SECTIONS))   # (offset, length) each
+_SNAP_TYPES = {"dir": "I", "size": "q", "mtime": "d", "name_off": "Q", "lower_off": "Q",
+               "dir_ids": "I", "dir_off": "Q"}
+_snapshots = {}                     # db path -> Snapshot
+_snapshot_lock = threading.Lock()
+
+def snapshot_path(db_path=None):
+    return _db(db_path).with_suffix(".snap")
+
+def _blob(strings):
+    """NUL-joined utf-8 blob and its start offsets (n + 1 of them)."""
+    offs = array.array("Q", [0])
+    parts = []
+    pos = 0
+    for s in strings:
+        b = s.encode("utf-8", "surrogatepass") + b"\0"
+        parts.append(b)
+        pos += len(b)
+        offs.append(pos)
+    return b"".join(parts), offs
+
+def build_snapshot(db_path=None):
+    """Write <index>.snap for the index as it is now (atomically replaced)."""
+    db_path = _db(db_path)
+    con = sqlite3.connect(f"{db_path.as_uri()}?mode=ro", uri=True)
+    try:
+        con.execute("BEGIN")            # one consistent read for every column
+        version, gen = index_version(con), index_generation(con)
+        paths = dir_paths(con)
+        cols = {k: array.array(t) for k, t in _SNAP_TYPES.items()}
+        names = []
+        for dir_id, name, size, mtime in con.execute(
+                "SELECT dir_id, name, size, mtime FROM files ORDER BY id"):
+            cols["dir"].append(dir_id)
+            cols["size"].append(size or 0)
+            cols["mtime"].append(mtime or 0.0)
+            names.append(name)
+        con.rollback()
+    finally:
+        con.close()
+    blobs = {}
+    blobs["names"], cols["name_off"] = _blob(names)
+    blobs["lower"], cols["lower_off"] = _blob(n.lower() for n in names)
+    ids = sorted(paths)
+    cols["dir_ids"] = array.array("I", ids)
+    blobs["dir_paths"], cols["dir_off"] = _blob(paths[i] for i in ids)
+
+    path = snapshot_path(db_path)
+    tmp = path.with_suffix(".snap.tmp")
+    table = []
+    pos = _SNAP_HEAD.size + _SNAP_TABLE.size
+    for name in SNAPSHOT_SECTIONS:
+        data = cols[name].tobytes() if name in cols else blobs[name]
+        pos += -pos % 8                 # keep arrays aligned for memoryview.cast
+        table.append((pos, data))
+        pos += len(data)
+    with open(tmp, "wb") as f:
+        f.write(_SNAP_HEAD.pack(SNAPSHOT_MAGIC, version, gen, len(names), len(ids)))
+        f.write(_SNAP_TABLE.pack(*[v for off, data in table for v in (off, len(data))]))
+        for off, data in table:
+            f.write(b"\0" * (off - f.tell()))
+            f.write(data)
+    try:
+        os.replace(tmp, path)
+    except PermissionError:
+        # Windows won't replace a mapped file: let go of ours and retry once
+        _drop_snapshot(db_path)
+        os.replace(tmp, path)
+    return path
+
+def restamp_snapshot(db_path, old_version):
+    """A pass that changed no rows leaves the snapshot's contents valid: if it
+       was current at old_version, mark it current now without rewriting it."""
+    db_path = _db(db_path)
+    path = snapshot_path(db_path)
+    try:
+        with open(path, "r+b") as f:
+            magic, version, _gen, n_files, n_dirs = _SNAP_HEAD.unpack(f.read(_SNAP_HEAD.size))
+            if magic != SNAPSHOT_MAGIC or version != old_version:
+                return False
+            with read_connection(db_path) as con:
+                version, gen = index_version(con), index_generation(con)
+            f.seek(0)
+            f.write(_SNAP_HEAD.pack(magic, version, gen, n_files, n_dirs))
+        return True
+    except (OSError, struct.error):
+        return False
+
+class Snapshot:
+    """A mapped .snap file. Arrays are memoryview casts of the mapping."""
+
+    def __init__(self, path):
+        self.path = path
+        st = os.stat(path)
+        self.key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.generation, self.files, self.dirs = \
+            _SNAP_HEAD.unpack_from(self.mm, 0)
+        if magic != SNAPSHOT_MAGIC:
+            self.mm.close()
+            raise ValueError(f"not a snapshot: {path}")
+        table = _SNAP_TABLE.unpack_from(self.mm, _SNAP_HEAD.size)
+        self.span = {name: (table[2 * i], table[2 * i] + table[2 * i + 1])
+                     for i, name in enumerate(SNAPSHOT_SECTIONS)}
+        self._dir_cache = {}
+
+    def current_version(self):
+        # re-read: restamp_snapshot may have moved it forward in place
+        return _SNAP_HEAD.unpack_from(self.mm, 0)[1]
+
+    def _col(self, name):
+        lo, hi = self.span[name]
+        return memoryview(self.mm)[lo:hi].cast(_SNAP_TYPES[name])
+
+    def _text(self, blob, offs, i):
+        lo = self.span[blob][0]
+        return self.mm[lo + offs[i]:lo + offs[i + 1] - 1].decode("utf-8", "surrogatepass")
+
+    def _dir(self, dir_id, dir_ids, dir_off):
+        p = self._dir_cache.get(dir_id)
+        if p is None:
+            k = bisect.bisect_left(dir_ids, dir_id)
+            p = self._text("dir_paths", dir_off, k) if k < len(dir_ids) and dir_ids[k] == dir_id else ""
+            self._dir_cache[dir_id] = p
+        return p
+
+    def search(self, pattern, limit=RESULT_LIMIT, parent_filter=None, cancel=None):
+        """Rows whose name contains pattern, case-insensitive, in index order.
+           Returns (rows, names examined by the scan)."""
+        needle = pattern.lower().encode("utf-8", "surrogatepass")
+        pf = parent_filter.lower() if parent_filter else None
+        lo, hi = self.span["lower"]
+        lower_off = self._col("lower_off")
+        cols = [self._col(c) for c in ("name_off", "dir", "size", "mtime", "dir_ids", "dir_off")]
+        name_off, dirs, sizes, mtimes, dir_ids, dir_off = cols
+        out = []
+        pos = lo
+        examined = 0
+        try:
+            while len(out) < limit:
+                j = self.mm.find(needle, pos, hi)
+                if j < 0:
+                    break
+                # which name the hit is in, then carry on after that name
+                i = bisect.bisect_right(lower_off, j - lo) - 1
+                pos = lo + lower_off[i + 1]
+                examined += 1
+                if cancel and examined % 4096 == 0 and cancel():
+                    raise QueryCancelled()
+                parent = self._dir(dirs[i], dir_ids, dir_off)
+                if pf is not None and pf not in parent.lower():
+                    continue
+                n = self._text("names", name_off, i)
+                try:
+                    iso_mtime = datetime.fromtimestamp(mtimes[i]).isoformat(timespec="seconds")
+                except Exception:
+                    iso_mtime = ""
+                out.append((os.path.join(parent, n), n, parent, sizes[i], iso_mtime))
+        finally:
+            for c in cols + [lower_off]:
+                c.release()             # no exports left, so the map can be closed
+        return out, examined
+
+    def close(self):
+        try:
+            self.mm.close()
+        except BufferError:
+            pass                        # a search still holds a view; GC closes it
+
+def _drop_snapshot(db_path):
+    with _snapshot_lock:
+        snap = _snapshots.pop(_db(db_path), None)
+    if snap is not None:
+        snap.close()
+
+def snapshot_for(db_path, version):
+    """The mapped snapshot of db_path if it matches index version, else None."""
+    db_path = _db(db_path)
+    path = snapshot_path(db_path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _snapshot_lock:
+        snap = _snapshots.get(db_path)
+        if snap is None or snap.key != key:
+            try:
+                snap = Snapshot(path)
+            except (OSError, ValueError, struct.error):
+                return None
+            _snapshots[db_path] = snap
+    return snap if snap.current_version() == version else None
+
+def snapshot_can_answer(pattern, in_path, order_by):
+    """Plain name substrings, unsorted: what a scan of the blob does exactly."""
+    return (not in_path and not order_by and bool(pattern) and is_plain(pattern)
+            and not is_structured(pattern) and "\0" not in pattern)
+
+# result-row sort keys matching ORDER_BY, for merging sorted shard results
+ROW_ORDER = {
+    "name":   lambda r: r[1].lower(),
+    "folder": lambda r: (r[2], r[1].lower()),
+    "size":   lambda r: r[3],
+    "mtime":  lambda r: r[4],
+}
+_shard_exec = None
+_shard_exec_lock = threading.Lock()
+
+def query_shards(pattern, roots, in_path=False, limit=RESULT_LIMIT, parent_filter=None,
+                 cancel=None, order_by=None, descending=False, on_rows=None, stats=None):
+    """query_db on every root's shard at once, with `limit` applied to the
+       merged result. Unordered rows are taken shard by shard as each one
+       answers (on_rows(rows) sees them then, so a slow root doesn't hold back
+       the others); ordered ones are a merge of the sorted shard results.
+       stats (a dict) gets the shards' sql_s/filter_s/examined summed, plus
+       the wall-clock seconds and rows returned after the merge."""
+    global _shard_exec
+    with _shard_exec_lock:
+        if _shard_exec is None:
+            _shard_exec = concurrent.futures.ThreadPoolExecutor(
+                SHARD_QUERY_WORKERS, thread_name_prefix="shard")
+    t0 = time.perf_counter()
+    shards = [p for p in map(shard_path, top_roots(roots)) if p.exists()]
+    per_shard = [{} for _ in shards]
+    futs = [_shard_exec.submit(query_db, pattern, in_path, limit, parent_filter, cancel,
+                               order_by, descending, p, st)
+            for p, st in zip(shards, per_shard)]
+    if order_by:
+        merged = heapq.merge(*(f.result() for f in futs),
+                             key=ROW_ORDER[order_by], reverse=descending)
+        out = list(itertools.islice(merged, limit))
+        if on_rows and out:
+            on_rows(out)
+    else:
+        out = []
+        for fut in concurrent.futures.as_completed(futs):
+            rows = fut.result()[:limit - len(out)]
+            if rows:
+                out += rows
+                if on_rows:
+                    on_rows(rows)
+            if len(out) >= limit:
+                break
+    if stats is not None:
+        stats.update(shards=len(shards), seconds=time.perf_counter() - t0, returned=len(out),
+                     **{k: sum(st.get(k, 0) for st in per_shard)
+                        for k in ("sql_s", "filter_s", "examined")})
+    return out
+
+
+# --- content search
+#   *.py content:TODO       literal, case-sensitive, via mmap.find
+#   content:"/def \w+_db/"  regex over the mapped bytes
+_CONTENT_RX = re.compile(r'(?:^|\s)content:(?:"([^"]*)"|(\S+))', re.IGNORECASE)
+_content_pool = None
+_content_pool_lock = threading.Lock()
+
+def split_content(pattern):
+    """'*.py content:foo' -> ('*.py', 'foo'); (pattern, None) without a content: term."""
+    m = _CONTENT_RX.search(pattern)
+    if not m:
+        return pattern, None
+    needle = m.group(1) if m.group(1) is not None else m.group(2)
+    rest = (pattern[:m.start()] + " " + pattern[m.end():]).strip()
+    return rest, needle
+
+# non-blocking so a FIFO's open() returns at once (it is then skipped by fstat)
+_CONTENT_OPEN = os.O_RDONLY | getattr(os, "O_NONBLOCK", 0) | getattr(os, "O_BINARY", 0)
+
+def _file_matches(path, size, needle, rx):
+    if size <= 0 or size > CONTENT_MAX_BYTES:
+        return False
+    try:
+        fd = os.open(path, _CONTENT_OPEN)
+    except OSError:
+        return False        # gone or unreadable
+    try:
+        # the index has the lstat size; a symlink opens its target, and the
+        # file may have been replaced since, so decide on what was opened
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode) or not 0 < st.st_size <= CONTENT_MAX_BYTES:
+            return False
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+            if mm.find(b"\0", 0, BINARY_SNIFF) != -1:
+                return False
+            if rx is None:
+                return mm.find(needle) != -1
+            return rx.search(mm) is not None
+    except (OSError, ValueError):
+        return False        # unreadable, or shrank while being mapped
+    finally:
+        os.close(fd)
+
+def _scan_batch(files, needle, regex):
+    """Runs in a pool process: indices of the (path, size) pairs whose contents match."""
+    rx = re.compile(regex) if regex is not None else None
+    return [i for i, (path, size) in enumerate(files) if _file_matches(path, size, needle, rx)]
+
+def _pool():
+    global _content_pool
+    with _content_pool_lock:
+        if _content_pool is None:
+            _content_pool = concurrent.futures.ProcessPoolExecutor(max_workers=CONTENT_WORKERS)
+        return _content_pool
+
+def search_content(pattern, needle, in_path=False, parent_filter=None, limit=RESULT_LIMIT,
+                   cancel=None, on_rows=None, roots=None):
+    """Rows of query_db(pattern, ...) whose contents contain needle (or match it
+       when it's /regex/). Only files passing the index filters are opened, in a
+       process pool; on_rows(rows) gets each batch of hits as it completes.
+       With roots, candidates come from those roots' shards."""
+    if not needle:
+        raise QuerySyntaxError("content: needs a value")
+    if is_regex(needle):
+        try:
+            regex = needle[1:-1].encode("utf-8")
+            re.compile(regex)
+        except (re.error, UnicodeEncodeError) as e:
+            raise QuerySyntaxError(f"bad content regex: {e}")
+        literal = None
+    else:
+        regex, literal = None, needle.encode("utf-8")
+
+    if roots is not None:
+        found = query_shards(pattern or "*", roots, in_path=in_path, limit=CONTENT_CANDIDATES,
+                             parent_filter=parent_filter, cancel=cancel)
+    else:
+        found = query_db(pattern or "*", in_path=in_path, limit=CONTENT_CANDIDATES,
+                         parent_filter=parent_filter, cancel=cancel)
+    candidates = [r for r in found if 0 < r[3] <= CONTENT_MAX_BYTES]
+    pool = _pool()
+    pending = {}
+    for i in range(0, len(candidates), CONTENT_BATCH):
+        batch = candidates[i:i + CONTENT_BATCH]
+        fut = pool.submit(_scan_batch, [(r[0], r[3]) for r in batch], literal, regex)
+        pending[fut] = batch
+
+    out = []
+    try:
+        for fut in concurrent.futures.as_completed(pending):
+            if cancel and cancel():
+                raise QueryCancelled()
+            batch = pending[fut]
+            rows = [batch[i] for i in fut.result()][:limit - len(out)]
+            if rows:
+                out += rows
+                if on_rows:
+                    on_rows(rows)
+            if len(out) >= limit:
+                break
+    finally:
+        for fut in pending:
+            fut.cancel()
+    return out
+
+
+# --- duplicate finder
+#   size (SQL GROUP BY) -> hash of both ends -> full hash, each stage only
+#   for what still collides. Digests are kept in `hashes` by (path, size, mtime).
+def _partial_digest(path, size, stop_flag=None):
+    with open(path, "rb") as f:
+        if size <= 2 * DUP_PARTIAL_BYTES:
+            return hashlib.blake2b(f.read()).digest()
+        h = hashlib.blake2b(f.read(DUP_PARTIAL_BYTES))
+        f.seek(-DUP_PARTIAL_BYTES, os.SEEK_END)
+        h.update(f.read(DUP_PARTIAL_BYTES))
+        return h.digest()
+
+def _full_digest(path, size, stop_flag=None):
+    h = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            if stop_flag and stop_flag.is_set():
+                raise QueryCancelled()      # don't finish a multi-GB file after a cancel
+            h.update(chunk)
+    return h.digest()
+
+def _collisions(files, key):
+    """Keep only the groups of files (dicts) sharing key with another file."""
+    groups = collections.defaultdict(list)
+    for f in files:
+        groups[key(f)].append(f)
+    return [g for g in groups.values() if len(g) > 1]
+
+def _hash_stage(pool, files, field, digest, stop_flag):
+    """Fill f[field] where the cache didn't have it; unreadable files drop out."""
+    todo = [f for f in files if f[field] is None]
+    futs = {pool.submit(digest, f["path"], f["size"], stop_flag): f for f in todo}
+    for fut in concurrent.futures.as_completed(futs):
+        if stop_flag and stop_flag.is_set():
+            for other in futs:
+                other.cancel()
+            raise QueryCancelled()
+        try:
+            futs[fut][field] = fut.result()
+            futs[fut]["dirty"] = True
+        except OSError:
+            pass
+    return [f for f in files if f[field] is not None]
+
+def find_duplicates(min_size=1, parent_filter=None, progress_cb=None, stop_flag=None,
+                    roots=None):
+    """Groups of identical files, largest waste first. Each group is a list of
+       query_db-style rows (path, name, parent, size, iso_mtime).
+       Only sizes shared by 2+ files are read at all; of those only the ends are
+       hashed unless the ends match too. progress_cb(msg) gets stage updates.
+       With roots, duplicates are found across those roots' shards."""
+    report = progress_cb or (lambda msg: None)
+    if roots is not None:
+        dbs = [p for p in map(shard_path, top_roots(roots)) if p.exists()]
+    else:
+        dbs = [DB_PATH]
+    where = """
+    WHERE f.size >= ?
+      AND NOT EXISTS (SELECT 1 FROM dirs d WHERE d.parent_id = f.dir_id AND d.name = f.name)
+    """
+    # sizes are counted over every index first: a duplicate may sit in another shard
+    sizes = collections.Counter()
+    filters = {}
+    for db in dbs:
+        sql, params = where, [min_size]
+        if parent_filter:
+            sql += " AND f.dir_id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(_dirs_containing(parent_filter, db)))
+        filters[db] = (sql, params)
+        with read_connection(db) as con:
+            for size, n in con.execute(f"SELECT f.size, COUNT(*) FROM files f {sql} GROUP BY f.size",
+                                       params):
+                sizes[size] += n
+    shared = json.dumps([size for size, n in sizes.items() if n > 1])
+
+    files = []
+    for db in dbs:
+        sql, params = filters[db]
+        with read_connection(db) as con:
+            dirs = _load_dirs(con, db)
+            rows = con.execute(f"SELECT f.dir_id, f.name, f.size, f.mtime FROM files f {sql}"
+                               " AND f.size IN (SELECT value FROM json_each(?))",
+                               params + [shared]).fetchall()
+            files += [{"db": db, "path": os.path.join(dirs.path(con, d), n), "name": n,
+                       "parent": dirs.path(con, d), "size": size, "mtime": mtime,
+                       "partial": None, "full": None, "dirty": False}
+                      for d, n, size, mtime in rows]
+    # the index holds a symlink's own (lstat) size, but opening it reads the
+    # target: it would be grouped by one and hashed as the other
+    files = [f for f in files if not os.path.islink(f["path"])]
+    report(f"{len(files):,} files share a size")
+    candidates = files
+
+    cons = {db: sqlite3.connect(db) for db in dbs}
+    try:
+        for f in files:
+            hit = cons[f["db"]].execute(
+                "SELECT partial, full FROM hashes WHERE path=? AND size=? AND mtime=?",
+                (f["path"], f["size"], f["mtime"])).fetchone()
+            if hit:
+                f["partial"], f["full"] = hit
+
+        with concurrent.futures.ThreadPoolExecutor(DUP_WORKERS, thread_name_prefix="hash") as pool:
+            files = _hash_stage(pool, files, "partial", _partial_digest, stop_flag)
+            files = [f for g in _collisions(files, lambda f: (f["size"], f["partial"])) for f in g]
+            for f in files:
+                if f["full"] is None and f["size"] <= 2 * DUP_PARTIAL_BYTES:
+                    f["full"] = f["partial"]        # the "ends" were the whole file
+            report(f"{len(files):,} files share their first and last bytes")
+            files = _hash_stage(pool, files, "full", _full_digest, stop_flag)
+        groups = _collisions(files, lambda f: (f["size"], f["full"]))
+
+        for db, con in cons.items():
+            dirty = [f for f in candidates if f["dirty"] and f["db"] == db]
+            # a file's digests are only good for its current size/mtime
+            con.executemany("DELETE FROM hashes WHERE path=?", [(f["path"],) for f in dirty])
+            con.executemany("INSERT INTO hashes(path, size, mtime, partial, full) VALUES(?,?,?,?,?)",
+                            [(f["path"], f["size"], f["mtime"], f["partial"], f["full"])
+                             for f in dirty])
+            con.commit()
+    finally:
+        for con in cons.values():
+            con.close()
+
+    groups.sort(key=lambda g: g[0]["size"] * (len(g) - 1), reverse=True)
+    report(f"{len(groups):,} duplicate groups")
+    out = []
+    for g in groups:
+        rows = []
+        for f in sorted(g, key=lambda f: f["path"]):
+            try:
+                iso_mtime = datetime.fromtimestamp(f["mtime"]).isoformat(timespec="seconds")
+            except Exception:
+                iso_mtime = ""
+            rows.append((f["path"], f["name"], f["parent"], f["size"], iso_mtime))
+        out.append(rows)
+    return out
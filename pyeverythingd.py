@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+'''
+   Headless pyeverything: keeps one warm index per host and answers queries
+   over a local socket (line-delimited JSON), plus a thin client.
+
+     python pyeverythingd.py serve --root /home --root /srv
+     python pyeverythingd.py query "*.iso" --sort size --desc
+     python pyeverythingd.py query "ext:log size:>100mb dm:last7days"
+     python pyeverythingd.py query "*.py content:TODO"
+     python pyeverythingd.py reindex
+     python pyeverythingd.py reindex --root /mnt/nas --full
+     python pyeverythingd.py dupes --folder /srv/share
+
+   Protocol: one JSON object per line in each direction.
+     {"op": "query", "pattern": "*.py", "in_path": false, "parent_filter": null,
+      "limit": 100, "order_by": null, "descending": false}
+       -> {"ok": true, "rows": [[path, name, parent, size, iso_mtime], ...]}
+     {"op": "duplicates", "parent_filter": null, "min_size": 1}
+       -> {"ok": true, "groups": [[row, row, ...], ...]}
+     {"op": "reindex", "root": null, "full": false} -> {"ok": true}
+       (background; every root, or just one root's shard)
+     {"op": "ping"}    -> {"ok": true, "entries": N, "indexing": ["/root", ...]}
+     {"op": "stats", "kind": null} -> {"ok": true, "records": [{"kind": "index", ...}, ...]}
+   Errors come back as {"ok": false, "error": "..."}.
+   Over TCP every request also carries "token": the daemon writes a fresh one
+   to TOKEN_PATH (readable by its user only) when it starts, and the client
+   reads it from there. The Unix socket needs no token.
+'''
+
+import os
+import sys
+import hmac
+import json
+import socket
+import secrets
+import argparse
+import threading
+import socketserver
+
+import pyeverything_core as core
+
+SOCK_PATH = core.DB_DIR / "pyeverything.sock"
+TCP_ADDR = ("127.0.0.1", 47800)     # used where AF_UNIX isn't available
+TOKEN_PATH = core.DB_DIR / "pyeverythingd.token"   # TCP clients must send its contents
+
+
+class Daemon:
+    """Each root has its own shard, watcher and reindex thread, so one slow or
+       busy root never holds up queries or reindexes of the others."""
+
+    def __init__(self, roots, watch=True):
+        self.roots = core.top_roots(roots)
+        self.watch = watch
+        self.watchers = {}
+        self._index_lock = threading.Lock()
+        self._indexing = set()
+
+    def start(self):
+        core.init_shards(self.roots)
+        self.reindex()
+
+    def reindex(self, root=None, full=False):
+        """Rescan every root (or one) in the background; each root's watcher
+           resumes after its own pass. full=True re-stats every file."""
+        if root is not None and os.path.abspath(root) not in self.roots:
+            raise ValueError(f"not an indexed root: {root}")
+        for r in [os.path.abspath(root)] if root else self.roots:
+            with self._index_lock:
+                if r in self._indexing:
+                    continue
+                self._indexing.add(r)
+                w = self.watchers.pop(r, None)
+            if w is not None:
+                w.stop()
+            threading.Thread(target=self._reindex, args=(r, full), daemon=True).start()
+
+    def _reindex(self, root, full):
+        try:
+            core.scan_roots([root], incremental=not full, db_path=core.shard_path(root))
+        finally:
+            with self._index_lock:
+                self._indexing.discard(root)
+                if self.watch:
+                    self.watchers[root] = core.start_watcher(
+                        [root], db_path=core.shard_path(root))
+
+    def handle(self, req):
+        op = req.get("op")
+        if op == "query":
+            pattern, needle = core.split_content(req.get("pattern") or "%")
+            if needle is not None:
+                rows = core.search_content(
+                    pattern, needle,
+                    in_path=bool(req.get("in_path")),
+                    parent_filter=req.get("parent_filter") or None,
+                    limit=int(req.get("limit") or core.RESULT_LIMIT),
+                    roots=self.roots,
+                )
+                return {"ok": True, "rows": rows}
+            rows = core.query_shards(
+                pattern, self.roots,
+                in_path=bool(req.get("in_path")),
+                limit=int(req.get("limit") or core.RESULT_LIMIT),
+                parent_filter=req.get("parent_filter") or None,
+                order_by=req.get("order_by") or None,
+                descending=bool(req.get("descending")),
+            )
+            return {"ok": True, "rows": rows}
+        if op == "duplicates":
+            groups = core.find_duplicates(
+                min_size=int(req.get("min_size") or 1),
+                parent_filter=req.get("parent_filter") or None,
+                roots=self.roots,
+            )
+            return {"ok": True, "groups": groups}
+        if op == "reindex":
+            self.reindex(req.get("root") or None, full=bool(req.get("full")))
+            return {"ok": True}
+        if op == "stats":
+            return {"ok": True, "records": core.recent_stats(req.get("kind") or None)}
+        if op == "ping":
+            with self._index_lock:
+                indexing = sorted(self._indexing)
+            return {"ok": True, "entries": core.shard_entries(self.roots), "indexing": indexing}
+        return {"ok": False, "error": f"unknown op: {op!r}"}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                req = json.loads(line)
+                token = self.server.token
+                if token is not None and not hmac.compare_digest(str(req.get("token", "")), token):
+                    resp = {"ok": False, "error": "bad or missing token"}
+                else:
+                    resp = self.server.index.handle(req)
+            except Exception as e:
+                resp = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(resp).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+def _unix_ok(tcp):
+    return not tcp and hasattr(socket, "AF_UNIX")
+
+
+def _write_token():
+    """A new random token in TOKEN_PATH, created readable by this user only."""
+    token = secrets.token_hex(32)
+    core.DB_DIR.mkdir(parents=True, exist_ok=True)
+    if TOKEN_PATH.exists():
+        TOKEN_PATH.unlink()
+    fd = os.open(TOKEN_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+def serve(roots, tcp=None, watch=True):
+    d = Daemon(roots, watch=watch)
+    d.start()
+    if _unix_ok(tcp):
+        core.DB_DIR.mkdir(parents=True, exist_ok=True)
+        if SOCK_PATH.exists():
+            SOCK_PATH.unlink()
+        server = socketserver.ThreadingUnixStreamServer(str(SOCK_PATH), _Handler)
+        server.token = None
+        where = str(SOCK_PATH)
+    else:
+        # any local user can reach a TCP port: only the token's owner may ask
+        server = socketserver.ThreadingTCPServer(tcp or TCP_ADDR, _Handler)
+        server.token = _write_token()
+        where = "%s:%d" % server.server_address[:2]
+    server.daemon_threads = True
+    server.index = d
+    print(f"{core.APP_NAME} daemon on {where}, roots: {', '.join(d.roots)}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if _unix_ok(tcp) and SOCK_PATH.exists():
+            SOCK_PATH.unlink()
+        if server.token is not None and TOKEN_PATH.exists():
+            TOKEN_PATH.unlink()
+
+
+def request(req, tcp=None):
+    """Send one request to the daemon and return the decoded reply."""
+    if _unix_ok(tcp):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(str(SOCK_PATH))
+    else:
+        try:
+            req = dict(req, token=TOKEN_PATH.read_text().strip())
+        except OSError:
+            pass                # the daemon will refuse it and say why
+        s = socket.create_connection(tcp or TCP_ADDR)
+    with s, s.makefile("rwb") as f:
+        f.write(json.dumps(req).encode("utf-8") + b"\n")
+        f.flush()
+        return json.loads(f.readline())
+
+
+def _tcp_arg(v):
+    host, _, port = v.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Headless pyeverything index/query daemon")
+    ap.add_argument("--tcp", type=_tcp_arg, default=None, metavar="HOST:PORT",
+                    help="use TCP instead of the Unix socket")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("serve", help="index roots, keep them watched, answer queries")
+    sp.add_argument("--root", action="append", help="root to index (repeatable)")
+    sp.add_argument("--no-watch", action="store_true", help="don't watch roots for changes")
+    sp.add_argument("--trace", default=None, metavar="FILE",
+                    help="append index/query metrics to FILE as JSON lines")
+
+    qp = sub.add_parser("query", help="search the daemon's index")
+    qp.add_argument("pattern", nargs="?", default="%")
+    qp.add_argument("--path", action="store_true", help="match against the full path")
+    qp.add_argument("--folder", default=None, help="in folder filter")
+    qp.add_argument("--limit", type=int, default=100)
+    qp.add_argument("--sort", choices=sorted(core.ORDER_BY), default=None)
+    qp.add_argument("--desc", action="store_true")
+    qp.add_argument("--json", action="store_true", help="print raw rows as JSON lines")
+
+    dp = sub.add_parser("dupes", help="list groups of identical files")
+    dp.add_argument("--folder", default=None, help="in folder filter")
+    dp.add_argument("--min-size", type=int, default=1, help="ignore smaller files (bytes)")
+
+    rp = sub.add_parser("reindex", help="ask the daemon for an incremental reindex")
+    rp.add_argument("--root", default=None, help="only this root's shard")
+    rp.add_argument("--full", action="store_true", help="re-stat every file, not just changed folders")
+    sub.add_parser("ping", help="check the daemon is up")
+    tp = sub.add_parser("stats", help="recent index/query metrics as JSON lines")
+    tp.add_argument("--kind", choices=("index", "query"), default=None)
+
+    args = ap.parse_args()
+    if args.cmd == "serve":
+        if args.trace:
+            core.set_trace(args.trace)
+        serve(args.root or core.DEFAULT_ROOTS, tcp=args.tcp, watch=not args.no_watch)
+        return
+
+    if args.cmd == "query":
+        req = {"op": "query", "pattern": args.pattern, "in_path": args.path,
+               "parent_filter": args.folder, "limit": args.limit,
+               "order_by": args.sort, "descending": args.desc}
+    elif args.cmd == "dupes":
+        req = {"op": "duplicates", "parent_filter": args.folder, "min_size": args.min_size}
+    elif args.cmd == "reindex":
+        req = {"op": "reindex", "root": args.root, "full": args.full}
+    elif args.cmd == "stats":
+        req = {"op": "stats", "kind": args.kind}
+    else:
+        req = {"op": args.cmd}
+    resp = request(req, tcp=args.tcp)
+    if not resp.get("ok"):
+        sys.exit(f"error: {resp.get('error')}")
+    if args.cmd == "query":
+        for row in resp["rows"]:
+            print(json.dumps(row) if args.json else row[0])
+    elif args.cmd == "dupes":
+        for group in resp["groups"]:
+            print(f"{group[0][3]:,} bytes x {len(group)}")
+            for row in group:
+                print("  " + row[0])
+    elif args.cmd == "stats":
+        for rec in resp["records"]:
+            print(json.dumps(rec))
+    elif args.cmd == "ping":
+        busy = resp["indexing"]
+        print(f"{resp['entries']:,} entries" + (f" (indexing {', '.join(busy)})" if busy else ""))
+
+
+if __name__ == "__main__":
+    main()
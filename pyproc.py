@@ -6,60 +6,298 @@ import re
 import html
 import shutil
 import subprocess
-from typing import Dict, List, Tuple, Optional, Set
-
-def f_getprocesses() -> Dict[int, psutil.Process]:
-    procs                   = {}
-    i                       = 1
-    for p in psutil.process_iter(attrs=[], ad_value=None):
-        print(f"     \r{i} ", end='', flush=True)
-        i                   += 1
-        try:
-            procs[p.pid] = p
-        except psutil.NoSuchProcess:
-            pass
-    return procs
+import json
+import threading
+import time
+import queue
+import bisect
+from typing import Dict, List, Tuple, Optional, Set, Iterator, TextIO
+
+SNAP_ATTRS                  = ["pid", "ppid", "name", "exe", "create_time"]
+EXT_WORKERS                 = 16        # threads collecting extended attributes
+EXT_TIMEOUT                 = 2.0       # seconds one process may take before it is given up on
+_DENIED                     = object()  # ad_value marker: psutil refused the attribute
+
+# extended attributes, cheapest first: a process is dropped at its first AccessDenied
+EXT_FIELDS                  = [
+    ("username",    lambda p: p.username()),
+    ("rss",         lambda p: p.memory_info().rss),
+    ("cpu",         lambda p: round(sum(p.cpu_times()[:2]), 2)),
+    ("cmdline",     lambda p: subprocess.list2cmdline(p.cmdline())),
+    ("files",       lambda p: len(p.open_files())),
+]
+
+class ProcTable:
+    """Struct-of-arrays process snapshot, filled by a single process_iter() pass.
+       Row i describes one process; row[pid] -> i. Nothing after the snapshot
+       goes back to psutil, so the tree is consistent with one point in time."""
+    __slots__               = ("pid", "ppid", "name", "exe", "ctime", "row", "denied", "ext")
+
+    def __init__(self):
+        self.pid: List[int]                 = []
+        self.ppid: List[int]                = []
+        self.name: List[Optional[str]]      = []
+        self.exe: List[Optional[str]]       = []
+        self.ctime: List[float]             = []
+        self.row: Dict[int, int]            = {}
+        self.denied: Set[int]               = set()
+        self.ext: Dict[int, dict]           = {}
+
+    def __len__(self) -> int:
+        return len(self.pid)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self.row
+
+    def add(self, pid: int, ppid: Optional[int], name: Optional[str], exe: Optional[str], ctime: Optional[float]) -> None:
+        self.row[pid]       = len(self.pid)
+        self.pid.append(pid)
+        self.ppid.append(-1 if ppid is None else ppid)
+        self.name.append(name)
+        self.exe.append(exe or None)
+        self.ctime.append(ctime or 0.0)
+
+    def remove(self, pid: int) -> None:
+        """Drop a row in O(1) by moving the last row into its slot."""
+        i                   = self.row.pop(pid)
+        cols                = (self.pid, self.ppid, self.name, self.exe, self.ctime)
+        if i != len(self.pid) - 1:
+            for col in cols:
+                col[i]      = col[-1]
+            self.row[self.pid[i]] = i
+        for col in cols:
+            col.pop()
+        self.denied.discard(pid)
+        self.ext.pop(pid, None)
+
+def f_addinfo(table: ProcTable, info: dict) -> None:
+    """Add one process_iter()/as_dict() result fetched with ad_value=_DENIED."""
+    i                       = {k: (None if v is _DENIED else v) for k, v in info.items()}
+    table.add(i["pid"], i["ppid"], i["name"], i["exe"], i["create_time"])
+    if info["name"] is _DENIED or info["exe"] is _DENIED:
+        table.denied.add(i["pid"])
 
-def f_mapchild(index: Dict[int, psutil.Process]) -> Dict[int, List[int]]:
+def f_getprocesses() -> ProcTable:
+    table                   = ProcTable()
+    for p in psutil.process_iter(attrs=SNAP_ATTRS, ad_value=_DENIED):
+        f_addinfo(table, p.info)
+        if len(table) % 256 == 0:
+            print(f"     \r{len(table)} ", end='', flush=True)
+    print(f"     \r{len(table)} ", end='', flush=True)
+    return table
+
+def f_extinfo(pid: int, ctime: float) -> Optional[dict]:
+    """Extended attributes of one process; None if it exited (or its PID was reused)."""
+    out                     = {}
+    try:
+        p                   = psutil.Process(pid)
+        if ctime and abs(p.create_time() - ctime) > 0.01:
+            return None
+        with p.oneshot():
+            for field, fetch in EXT_FIELDS:
+                out[field]  = fetch(p)
+    except psutil.NoSuchProcess:
+        return None
+    except psutil.AccessDenied:
+        out["denied"]       = True
+    return out
+
+def f_getextended(table: ProcTable, workers: int = EXT_WORKERS, timeout: float = EXT_TIMEOUT) -> None:
+    """Fill table.ext on a bounded set of daemon threads. A process that takes
+       longer than `timeout` is given up on and its thread replaced, so a hung
+       call costs one thread, not the report. Denied processes are skipped."""
+    todo: "queue.SimpleQueue[int]" = queue.SimpleQueue()
+    for pid in table.pid:
+        if pid not in table.denied:
+            todo.put(pid)
+    lock                    = threading.Lock()
+    busy: Dict[int, Tuple[int, float]] = {}     # thread ident -> (pid, start)
+    given_up: Set[int]      = set()
+
+    def worker() -> None:
+        me                  = threading.get_ident()
+        while True:
+            try:
+                pid         = todo.get_nowait()
+            except queue.Empty:
+                return
+            with lock:
+                busy[me]    = (pid, time.monotonic())
+            info            = f_extinfo(pid, table.ctime[table.row[pid]])
+            with lock:
+                del busy[me]
+                if pid in given_up:
+                    return                      # replaced already: let the spare finish up
+                if info is None:
+                    continue
+                table.ext[pid] = info
+                if info.get("denied"):
+                    table.denied.add(pid)
+
+    def spawn() -> threading.Thread:
+        t                   = threading.Thread(target=worker, daemon=True)
+        t.start()
+        return t
+
+    threads                 = [spawn() for _ in range(max(1, min(workers, len(table))))]
+    while True:
+        time.sleep(0.05)
+        now                 = time.monotonic()
+        with lock:
+            for pid, t0 in list(busy.values()):
+                if pid not in given_up and now - t0 > timeout:
+                    given_up.add(pid)
+                    table.ext[pid] = {"timeout": True}
+                    threads.append(spawn())
+            stuck           = sum(1 for pid, _ in busy.values() if pid in given_up)
+        threads             = [t for t in threads if t.is_alive()]
+        if len(threads) <= stuck and todo.empty():
+            break
+        print(f"     \r{len(table.ext)}/{len(table)} ", end='', flush=True)
+
+def f_mapchild(table: ProcTable) -> Dict[int, List[int]]:
     cm: Dict[int, List[int]] = {}
-    for pid, p in index.items():
-        try:
-            ppid = p.ppid()
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-        cm.setdefault(ppid, []).append(pid)
+    for pid, ppid in zip(table.pid, table.ppid):
+        if ppid != pid:
+            cm.setdefault(ppid, []).append(pid)
     for k in cm:
         cm[k].sort()
     return cm
 
-def f_getroots(index: Dict[int, psutil.Process]) -> List[int]:
-    rs = []
-    for pid, p in index.items():
-        try:
-            ppid = p.ppid()
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            ppid = -1
-        if ppid not in index:
-            rs.append(pid)
+def f_getroots(table: ProcTable) -> List[int]:
+    rs                      = [pid for pid, ppid in zip(table.pid, table.ppid) if ppid not in table.row or ppid == pid]
     return sorted(rs)
 
-def f_label2k10(p: psutil.Process) -> str:
-    try:
-        name = p.name()
-    except (psutil.NoSuchProcess, psutil.AccessDenied):
-        pass   
-    name = f'<font color="#c53335">{name}</font>&nbsp;<font size=-2 color="#666666">[{p.pid}]</font>'
-    try:
-        exe = p.exe()
-        if exe:
-            name = f'{name}\n<font size=-1 color="#0099e7">{exe}</font>'
-    except (psutil.AccessDenied, psutil.NoSuchProcess):
-        pass
+class ProcWatch:
+    """Keeps a ProcTable and its child map current between intervals. Only the
+       PID list is read for every process; attributes are fetched for new
+       processes and orphans of exited ones. Every survivor's create_time (one
+       read, no as_dict) is compared each tick to catch reused PIDs."""
+    __slots__               = ("table", "cmap")
+
+    def __init__(self, table: ProcTable):
+        self.table          = table
+        self.cmap           = f_mapchild(table)
+
+    def _event(self, kind: str, pid: int, **extra) -> dict:
+        ev                  = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "event": kind}
+        ev.update(f_record(self.table, pid))
+        ev.update(extra)
+        return ev
+
+    def _link(self, pid: int, ppid: int) -> None:
+        if ppid != pid:
+            bisect.insort(self.cmap.setdefault(ppid, []), pid)
+
+    def _unlink(self, pid: int, ppid: int) -> None:
+        kids                = self.cmap.get(ppid)
+        if kids and pid in kids:
+            kids.remove(pid)
+            if not kids:
+                del self.cmap[ppid]
+
+    def _reused(self, live: Set[int]) -> List[int]:
+        t                   = self.table
+        out                 = []
+        for pid in t.pid:
+            ctime           = t.ctime[t.row[pid]]
+            if pid not in live or not ctime:
+                continue        # exited, or its start time was never readable
+            try:
+                if abs(psutil.Process(pid).create_time() - ctime) > 0.01:
+                    out.append(pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        return out
+
+    def tick(self) -> List[dict]:
+        """Bring the table up to date; return start/exit/reparent events."""
+        t                   = self.table
+        live                = set(psutil.pids())
+        reused              = self._reused(live)
+        gone                = [pid for pid in t.pid if pid not in live] + reused
+        born                = [pid for pid in live if pid not in t] + reused
+        events: List[dict]  = []
+        orphans: Set[int]   = set()
+        for pid in gone:
+            events.append(self._event("exit", pid))
+            orphans.update(self.cmap.pop(pid, ()))
+            self._unlink(pid, t.ppid[t.row[pid]])
+            t.remove(pid)
+        for pid in sorted(born):
+            try:
+                info        = psutil.Process(pid).as_dict(attrs=SNAP_ATTRS, ad_value=_DENIED)
+            except psutil.NoSuchProcess:
+                continue                        # came and went within the interval
+            f_addinfo(t, info)
+            self._link(pid, t.ppid[t.row[pid]])
+            events.append(self._event("start", pid))
+        for pid in sorted(orphans):
+            if pid not in t:
+                continue
+            i               = t.row[pid]
+            old             = t.ppid[i]
+            try:
+                p           = psutil.Process(pid)
+                if abs(p.create_time() - t.ctime[i]) <= 0.01:
+                    t.ppid[i] = p.ppid()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass                            # exits next tick, or keeps its last known parent
+            self._link(pid, t.ppid[i])          # its old parent's child list is gone either way
+            if t.ppid[i] != old:
+                events.append(self._event("reparent", pid, old_ppid=old))
+        return events
+
+def f_watch(table: ProcTable, interval: float, log_path: str) -> None:
+    """Poll until Ctrl+C, appending each interval's events to log_path as JSON lines."""
+    watch                   = ProcWatch(table)
+    print(f"\nWatching {len(table)} processes every {interval}s, events -> {log_path} (Ctrl+C to stop)")
+    with open(log_path, "a", encoding="utf-8") as log:
+        try:
+            while True:
+                time.sleep(interval)
+                events      = watch.tick()
+                for ev in events:
+                    log.write(json.dumps(ev, ensure_ascii=False) + "\n")
+                log.flush()
+                if events:
+                    counts  = {k: sum(1 for e in events if e["event"] == k) for k in ("start", "exit", "reparent")}
+                    print(f'{time.strftime("%H:%M:%S")}  +{counts["start"]} -{counts["exit"]} ~{counts["reparent"]}  ({len(table)} processes)', flush=True)
+        except KeyboardInterrupt:
+            pass
+
+def f_label2k10(table: ProcTable, pid: int) -> str:
+    i                       = table.row[pid]
+    name                    = html.escape(table.name[i] or "?")
+    name                    = f'<font color="#c53335">{name}</font>&nbsp;<font size=-2 color="#666666">[{pid}]</font>'
+    exe                     = table.exe[i]
+    if exe:
+        name                = f'{name}\n<font size=-1 color="#0099e7">{html.escape(exe)}</font>'
+    ext                     = table.ext.get(pid)
+    if ext:
+        name                = f'{name}\n<font size=-2 color="#666666">{html.escape(f_extsummary(ext))}</font>'
     return name
 
+def f_extsummary(ext: dict) -> str:
+    if ext.get("timeout"):
+        return "timed out"
+    parts                   = []
+    if ext.get("username"):
+        parts.append(ext["username"])
+    if "rss" in ext:
+        parts.append(f'{ext["rss"] / 1048576:.1f} MB')
+    if "cpu" in ext:
+        parts.append(f'cpu {ext["cpu"]}s')
+    if "files" in ext:
+        parts.append(f'{ext["files"]} files')
+    if ext.get("cmdline"):
+        parts.append(ext["cmdline"])
+    if ext.get("denied"):
+        parts.append("access denied")
+    return " · ".join(parts)
 
 
-def f_walk(index, cmap, roots_list, mdepth, mnode):
+def f_walk(table: ProcTable, cmap, roots_list, mdepth, mnode):
     """Return nodes and edges for the filtered tree."""
     nodes: Set[int] = set()
     edges: List[Tuple[int, int]] = []
@@ -71,8 +309,7 @@ def f_walk(index, cmap, roots_list, mdepth, mnode):
         if pid in seen:
             continue
         seen.add(pid)
-        p = index.get(pid)
-        if not p:
+        if pid not in table:
             continue
         nodes.add(pid)
         if parent is not None and parent in nodes:
@@ -80,68 +317,244 @@ def f_walk(index, cmap, roots_list, mdepth, mnode):
         if depth >= mdepth:
             continue
         for cpid in reversed(cmap.get(pid, [])):
-            if cpid in index:
+            if cpid in table:
                 stack.append((cpid, depth + 1, pid))
         if len(nodes) >= mnode:
             break
     return nodes, edges
 
-def f_dohtml(index, nodes: Set[int], cmap: Dict[int, List[int]], roots_list: List[int]) -> str:
-    kept_children           = {pid: [c for c in cmap.get(pid, []) if c in nodes] for pid in nodes}
-    kept_roots              = [r for r in roots_list if r in nodes]
-
-    def label(pid: int) -> str:
-        p                   = index.get(pid)
-        if not p: 
-            return f"[{pid}]"
-        s                   = f_label2k10(p).replace("\\n", " — ")
-        return s
-
-    def render(pid: int) -> str:
-        kids                = kept_children.get(pid, [])
-        if not kids:
-            return f'<li><span class="leaf">{label(pid)}</span></li>'
-        inner               = "\n".join(render(c) for c in kids)
-        return f'<li><details open><summary>{label(pid)}</summary><ul>\n{inner}\n</ul></details></li>'
-
-    body                    = "\n".join(render(r) for r in kept_roots)
-    return f"""<!doctype html>
-        <html>
-            <head>
-                <meta charset="utf-8"/>
-                <title>Windows Process Tree</title>
-                <style>
-                     body {{ font-family: Consolas, monospace; }}
-                     ul {{ list-style-type: none; padding-left: 1rem; }}
-                     summary {{ cursor: pointer; }}
-                     .leaf {{ margin-left: 0.2rem; }}
-                </style>
-            </head>
-            <body>
-            <h2>MS Windows processes</h2>
-                <ul>
-                    {body}
-                </ul>
-            </body>
-        </html>
-    """
+HTML_HEAD                   = """<!doctype html>
+<html>
+    <head>
+        <meta charset="utf-8"/>
+        <title>Windows Process Tree</title>
+        <style>
+             body { font-family: Consolas, monospace; }
+             ul { list-style-type: none; padding-left: 1rem; }
+             summary { cursor: pointer; }
+             .leaf { margin-left: 0.2rem; }
+        </style>
+    </head>
+    <body>
+    <h2>MS Windows processes</h2>
+        <ul>
+"""
+HTML_TAIL                   = """        </ul>
+    </body>
+</html>
+"""
+WRITE_BUFFER                = 1 << 16   # bytes buffered before a write reaches the file
+
+def f_preorder(nodes: Set[int], cmap: Dict[int, List[int]], roots_list: List[int]) -> Iterator[Tuple[int, int, bool]]:
+    """Yield (pid, depth, has_kept_children) over the kept tree, depth first,
+       with an explicit stack: no recursion, nothing materialised per node."""
+    stack: List[Tuple[int, int]] = [(r, 0) for r in reversed(roots_list) if r in nodes]
+    seen: Set[int]          = set()
+    while stack:
+        pid, depth          = stack.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        kids                = [c for c in cmap.get(pid, []) if c in nodes and c not in seen]
+        yield pid, depth, bool(kids)
+        stack.extend((c, depth + 1) for c in reversed(kids))
+
+def f_writehtml(f: TextIO, table: ProcTable, nodes: Set[int], cmap: Dict[int, List[int]], roots_list: List[int]) -> int:
+    """Stream the tree as nested <details open> lists to f. Returns nodes written."""
+    f.write(HTML_HEAD)
+    opened                  = 0         # <details> currently open
+    n                       = 0
+    for pid, depth, has_kids in f_preorder(nodes, cmap, roots_list):
+        while opened > depth:
+            f.write("</ul></details></li>\n")
+            opened          -= 1
+        label               = f_label2k10(table, pid).replace("\n", " — ")
+        if has_kids:
+            f.write(f'<li><details open><summary>{label}</summary><ul>\n')
+            opened          += 1
+        else:
+            f.write(f'<li><span class="leaf">{label}</span></li>\n')
+        n                   += 1
+    f.write("</ul></details></li>\n" * opened)
+    f.write(HTML_TAIL)
+    return n
+
+LAZY_HEAD                   = """<!doctype html>
+<html>
+    <head>
+        <meta charset="utf-8"/>
+        <title>Windows Process Tree</title>
+        <style>
+             body { font-family: Consolas, monospace; }
+             ul { list-style-type: none; padding-left: 1rem; margin: 0; }
+             summary { cursor: pointer; }
+             .leaf { margin-left: 1.1rem; }
+             .name { color: #c53335; }
+             .pid { color: #666666; font-size: smaller; }
+             .exe { color: #0099e7; font-size: smaller; margin-left: 0.6rem; }
+             .info { color: #666666; font-size: smaller; margin-left: 0.6rem; }
+             .path { color: #999999; font-size: smaller; margin-left: 0.6rem; }
+             #filter { width: 24rem; margin-bottom: 0.6rem; }
+        </style>
+    </head>
+    <body>
+    <h2>MS Windows processes</h2>
+    <input id="filter" placeholder="filter by name or PID" autofocus/> <span id="count"></span>
+    <ul id="tree"></ul>
+    <script id="data" type="application/json">"""
+LAZY_TAIL                   = """</script>
+    <script>
+    const D = JSON.parse(document.getElementById("data").textContent);
+    const row = new Map(), kids = new Map();
+    D.pid.forEach((pid, i) => row.set(pid, i));
+    D.pid.forEach((pid, i) => {
+        const pp = D.ppid[i];
+        if (pp !== pid && row.has(pp)) { if (!kids.has(pp)) kids.set(pp, []); kids.get(pp).push(pid); }
+    });
+    const span = (cls, text) => { const s = document.createElement("span"); s.className = cls; s.textContent = text; return s; };
+    function label(el, pid) {
+        const i = row.get(pid);
+        el.append(span("name", D.name[i] || "?"), " ", span("pid", "[" + pid + "]"));
+        if (D.exe[i]) el.append(span("exe", D.exe[i]));
+        if (D.info[i]) el.append(span("info", D.info[i]));
+        return el;
+    }
+    function node(pid) {
+        const li = document.createElement("li"), ks = kids.get(pid);
+        if (!ks) { li.append(label(span("leaf", ""), pid)); return li; }
+        const d = document.createElement("details"), sm = document.createElement("summary");
+        d.append(label(sm, pid));
+        d.addEventListener("toggle", () => {          // children are built on first expand only
+            if (!d.open || d.childElementCount > 1) return;
+            const ul = document.createElement("ul");
+            ul.append(...ks.map(node));
+            d.append(ul);
+        });
+        li.append(d);
+        return li;
+    }
+    const tree = document.getElementById("tree"), count = document.getElementById("count");
+    function showTree() {
+        tree.replaceChildren(...D.roots.map(node));
+        count.textContent = D.pid.length + " processes";
+    }
+    function ancestry(pid) {
+        const names = [];
+        for (let i = row.get(pid), n = 0; n < 64; n++) {
+            const pp = D.ppid[i];
+            if (pp === D.pid[i] || !row.has(pp)) break;
+            i = row.get(pp);
+            names.unshift(D.name[i] || "?");
+        }
+        return names.join(" › ");
+    }
+    function showMatches(q) {
+        const out = [], limit = 1000;
+        let hits = 0;
+        D.pid.forEach((pid, i) => {
+            if (String(pid).startsWith(q) || (D.name[i] || "").toLowerCase().includes(q)) {
+                if (++hits <= limit) {
+                    const li = node(pid), first = li.firstChild;
+                    (first.tagName === "DETAILS" ? first.firstChild : first).append(span("path", ancestry(pid)));
+                    out.push(li);
+                }
+            }
+        });
+        tree.replaceChildren(...out);
+        count.textContent = hits + " matching" + (hits > limit ? ", first " + limit + " shown" : "");
+    }
+    let pending = 0;
+    document.getElementById("filter").addEventListener("input", e => {
+        clearTimeout(pending);
+        const q = e.target.value.trim().toLowerCase();
+        pending = setTimeout(() => q ? showMatches(q) : showTree(), 150);
+    });
+    showTree();
+    </script>
+    </body>
+</html>
+"""
+
+def f_jsonarray(f: TextIO, values: Iterator) -> None:
+    """Write one JSON array element by element; "</" is escaped so the data
+       can sit inside a <script> block."""
+    f.write("[")
+    for n, v in enumerate(values):
+        f.write(("," if n else "") + json.dumps(v, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/"))
+    f.write("]")
+
+def f_writelazy(f: TextIO, table: ProcTable, nodes: Set[int], cmap: Dict[int, List[int]], roots_list: List[int]) -> int:
+    """HTML viewer that embeds the kept rows as compact column arrays and only
+       builds a node's children in the browser when it is expanded, with a
+       name/PID filter. The page's DOM starts at the roots, whatever the size."""
+    order                   = [pid for pid, _, _ in f_preorder(nodes, cmap, roots_list)]
+    rows                    = [table.row[pid] for pid in order]
+    f.write(LAZY_HEAD)
+    f.write('{"roots":')
+    f_jsonarray(f, (r for r in roots_list if r in nodes))
+    for key, column in (("pid", table.pid), ("ppid", table.ppid), ("name", table.name), ("exe", table.exe)):
+        f.write(f',"{key}":')
+        f_jsonarray(f, (column[i] for i in rows))
+    f.write(',"info":')
+    f_jsonarray(f, (f_extsummary(table.ext[pid]) if pid in table.ext else "" for pid in order))
+    f.write("}")
+    f.write(LAZY_TAIL)
+    return len(order)
+
+def f_record(table: ProcTable, pid: int) -> dict:
+    i                       = table.row[pid]
+    rec                     = {"pid": pid, "ppid": table.ppid[i], "name": table.name[i],
+                               "exe": table.exe[i], "create_time": table.ctime[i]}
+    rec.update(table.ext.get(pid, {}))
+    return rec
+
+def f_writejson(f: TextIO, table: ProcTable, nodes: Set[int], cmap: Dict[int, List[int]], roots_list: List[int], ndjson: bool = False) -> int:
+    """Stream the kept tree in pre-order, one object per process carrying its
+       depth: a JSON array, or one object per line with ndjson=True."""
+    sep                     = "\n" if ndjson else ",\n"
+    f.write("" if ndjson else "[\n")
+    n                       = 0
+    for pid, depth, _ in f_preorder(nodes, cmap, roots_list):
+        rec                 = f_record(table, pid)
+        rec["depth"]        = depth
+        f.write((sep if n else "") + json.dumps(rec, ensure_ascii=False))
+        n                   += 1
+    f.write("\n" if ndjson else "\n]\n")
+    return n
 
 
 def main():
-    ap                  = argparse.ArgumentParser(description="Export MS Windows process tree to HTML")
-    ap.add_argument("-o","--output", default="pyproc.html", help="Name of the html file")
+    ap                  = argparse.ArgumentParser(description="Export MS Windows process tree to HTML or JSON")
+    ap.add_argument("-o","--output", default=None, help="Name of the output file (default pyproc.<format>)")
+    ap.add_argument("--format", choices=("html", "lazy", "json", "ndjson"), default="html",
+                    help="Output format: html (fully expanded), lazy (expand on demand, with a filter), json, ndjson")
     ap.add_argument("--depth", type=int, default=30, help="Max depth")
     ap.add_argument("--node", type=int, default=96000, help="Max nodes")
+    ap.add_argument("--extended", action="store_true", help="Also collect cmdline, user, memory, cpu and open files")
+    ap.add_argument("--workers", type=int, default=EXT_WORKERS, help="Threads for --extended")
+    ap.add_argument("--timeout", type=float, default=EXT_TIMEOUT, help="Seconds per process for --extended")
+    ap.add_argument("--watch", type=float, default=None, metavar="INTERVAL",
+                    help="Keep polling every INTERVAL seconds and log process starts/exits/re-parents; the tree is written on Ctrl+C")
+    ap.add_argument("--log", default="pyproc-events.ndjson", help="Event log appended to by --watch")
     args                = ap.parse_args()
-    index               = f_getprocesses()
-    cmap                = f_mapchild(index)
-    rts                 = f_getroots(index)
-    kept_nodes, edges   = f_walk(index, cmap, rts, args.depth, args.node)
-    out                 = str(args.output) 
-    html_text           = f_dohtml(index, kept_nodes, cmap, rts)
-    with open(out, "w", encoding="utf-8") as f:
-        f.write(html_text)
-    print(f"\nWrote HTML: {out}")
+    table               = f_getprocesses()
+    if args.watch:
+        f_watch(table, args.watch, args.log)
+    if args.extended:
+        f_getextended(table, args.workers, args.timeout)
+    cmap                = f_mapchild(table)
+    rts                 = f_getroots(table)
+    kept_nodes, edges   = f_walk(table, cmap, rts, args.depth, args.node)
+    ext                 = "html" if args.format == "lazy" else args.format
+    out                 = str(args.output or f"pyproc.{ext}")
+    with open(out, "w", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+        if args.format == "html":
+            n           = f_writehtml(f, table, kept_nodes, cmap, rts)
+        elif args.format == "lazy":
+            n           = f_writelazy(f, table, kept_nodes, cmap, rts)
+        else:
+            n           = f_writejson(f, table, kept_nodes, cmap, rts, ndjson=args.format == "ndjson")
+    print(f"\nWrote {args.format.upper()}: {out} ({n} processes)")
 
 if __name__ == "__main__":
     main()